@@ -0,0 +1,207 @@
+"""
+MySQL backend (pymysql) that keeps a bounded pool of open connections
+per database instead of connecting and authenticating on every request.
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'config.mysql_pool',
+            ...
+            'POOL': {'MAX_SIZE': 10, 'TIMEOUT': 10, 'RECYCLE': 3600, 'PRE_PING': True},
+        }
+    }
+
+Connections go back to the pool when Django closes them at the end of a
+request, so CONN_MAX_AGE should stay at 0.
+"""
+import threading
+import time
+from collections import deque
+
+from django.db.backends.mysql import base as mysql_base
+from django.db.utils import OperationalError
+
+_pools={}
+_pools_lock=threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    """
+    Raised when no connection could be checked out within the timeout
+    """
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread safe bounded pool. Idle connections are reused last in first out
+    so the rest of the pool can age out through RECYCLE.
+    """
+    def __init__(self, connect, max_size=10, timeout=10, recycle=3600, pre_ping=True):
+        self._connect=connect
+        self.max_size=max_size
+        self.timeout=timeout
+        self.recycle=recycle
+        self.pre_ping=pre_ping
+        self._idle=deque()
+        self._size=0
+        self._cond=threading.Condition()
+        self.metrics={
+            'created':0,
+            'checkouts':0,
+            'timeouts':0,
+            'ping_failures':0,
+            'recycled':0,
+            'discarded':0,
+            'wait_seconds':0.0,
+        }
+
+    def checkout(self):
+        started=time.monotonic()
+        deadline=started+self.timeout
+        while True:
+            conn=None
+            with self._cond:
+                while not self._idle and self._size>=self.max_size:
+                    remaining=deadline-time.monotonic()
+                    if remaining<=0:
+                        self.metrics['timeouts']+=1
+                        raise PoolTimeout(
+                            f"No database connection available within {self.timeout}s"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn=self._idle.pop()
+                else:
+                    self._size+=1
+            if conn is None:
+                conn=self._open()
+            elif not self._healthy(conn):
+                self._discard(conn)
+                continue
+            with self._cond:
+                self.metrics['checkouts']+=1
+                self.metrics['wait_seconds']+=time.monotonic()-started
+            return conn
+
+    def checkin(self, conn, discard=False):
+        if discard:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self.metrics,
+                'size':self._size,
+                'idle':len(self._idle),
+                'in_use':self._size-len(self._idle),
+                'max_size':self.max_size,
+            }
+
+    def _open(self):
+        try:
+            conn=self._connect()
+        except Exception:
+            with self._cond:
+                self._size-=1
+                self._cond.notify()
+            raise
+        conn._pool_created_at=time.monotonic()
+        with self._cond:
+            self.metrics['created']+=1
+        return conn
+
+    def _healthy(self, conn):
+        if self.recycle and time.monotonic()-conn._pool_created_at>self.recycle:
+            with self._cond:
+                self.metrics['recycled']+=1
+            return False
+        if self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self.metrics['ping_failures']+=1
+                return False
+        return True
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size-=1
+            self.metrics['discarded']+=1
+            self._cond.notify()
+
+
+def get_pool(key, factory):
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key]=factory()
+        return _pools[key]
+
+
+def pool_stats():
+    """
+    metrics for every pool in this process, keyed by database alias
+    """
+    with _pools_lock:
+        return {key[0]:pool.stats() for key, pool in _pools.items()}
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+    @property
+    def pool_options(self):
+        options=self.settings_dict.get('POOL')
+        if not options or not options.get('MAX_SIZE', 10):
+            return None
+        return options
+
+    def _pool_key(self):
+        return (
+            self.alias,
+            self.settings_dict['NAME'],
+            self.settings_dict['HOST'],
+            self.settings_dict['PORT'],
+            self.settings_dict['USER'],
+        )
+
+    @property
+    def pool(self):
+        options=self.pool_options
+        if options is None:
+            return None
+        conn_params=self.get_connection_params()
+        return get_pool(self._pool_key(), lambda: ConnectionPool(
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 10),
+            recycle=options.get('RECYCLE', 3600),
+            pre_ping=options.get('PRE_PING', True),
+        ))
+
+    def get_new_connection(self, conn_params):
+        pool=self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        return pool.checkout()
+
+    def _close(self):
+        pool=self.pool
+        if self.connection is None or pool is None:
+            return super()._close()
+        # a connection closed inside atomic() stays attached to this wrapper,
+        # so it can't be handed to another thread
+        discard=self.in_atomic_block
+        if not discard:
+            try:
+                if not self.connection.get_autocommit():
+                    self.connection.rollback()
+            except Exception:
+                discard=True
+        pool.checkin(self.connection, discard=discard)
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'files.middleware.PrimaryPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,15 +85,53 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'config.mysql_pool',
         'NAME': 'fileshare_db',
         'HOST':'localhost',
         'PASSWORD':'12345678',
         'USER':'root',
-        'PORT':'3306'
+        'PORT':'3306',
+        'POOL': {
+            'MAX_SIZE': int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            'TIMEOUT': int(os.getenv("DB_POOL_TIMEOUT", 10)),
+            'RECYCLE': int(os.getenv("DB_POOL_RECYCLE", 3600)),
+            'PRE_PING': True,
+        },
     }
 }
 
+# read replicas, e.g. DB_REPLICA_HOSTS=replica1,replica2
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(","))):
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['files.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_LAG_TOLERANCE = int(os.getenv("DB_REPLICA_LAG_TOLERANCE", 5))
+
+# file list versions, signed URL revocations and download stream slots live
+# in the default cache and must be shared by every worker, deployments set
+# REDIS_URL (manage.py check --deploy fails on a process local cache)
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -157,3 +196,86 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL")
 
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL")
+
+OBJECT_STORAGE_BUCKET = os.getenv("OBJECT_STORAGE_BUCKET")
+
+# new uploads land on the hot tier, so with more than one web server it has to
+# be a volume every server mounts (NFS, EFS), manage.py check --deploy fails
+# while it is left on the server local MEDIA_ROOT
+FILE_STORAGE_HOT_ROOT = os.getenv("FILE_STORAGE_HOT_ROOT")
+
+STORAGES = {
+    "default": {
+        "BACKEND": "files.storage.TieredStorage",
+        "OPTIONS": {
+            "hot": {
+                "shard_depth": int(os.getenv("FILE_STORAGE_SHARD_DEPTH", 2)),
+                "shard_width": int(os.getenv("FILE_STORAGE_SHARD_WIDTH", 2)),
+                **({"location": FILE_STORAGE_HOT_ROOT} if FILE_STORAGE_HOT_ROOT else {}),
+            },
+            # cold tier is only enabled when a bucket is configured
+            "cold": {
+                "bucket": OBJECT_STORAGE_BUCKET,
+                "endpoint_url": os.getenv("OBJECT_STORAGE_ENDPOINT_URL"),
+                "access_key": os.getenv("OBJECT_STORAGE_ACCESS_KEY"),
+                "secret_key": os.getenv("OBJECT_STORAGE_SECRET_KEY"),
+                "region_name": os.getenv("OBJECT_STORAGE_REGION"),
+            } if OBJECT_STORAGE_BUCKET else None,
+        },
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+FILE_MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+# large uploads are spooled under <media root>/<FILE_UPLOAD_STAGING_DIR> and
+# renamed into place, small ones stay in memory
+FILE_UPLOAD_STAGING_DIR = ".staging"
+FILE_UPLOAD_HANDLERS = [
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "files.upload_handlers.StagedFileUploadHandler",
+]
+USER_STORAGE_QUOTA = 1 * 1024 * 1024 * 1024
+
+# content-defined chunk dedup for large uploads, off by default
+FILE_CHUNK_DEDUP = os.getenv("FILE_CHUNK_DEDUP") == "True"
+FILE_CHUNK_DEDUP_MIN_FILE_SIZE = 8 * 1024 * 1024
+FILE_CHUNK_MIN_SIZE = 256 * 1024
+FILE_CHUNK_AVG_SIZE = 1024 * 1024
+FILE_CHUNK_MAX_SIZE = 4 * 1024 * 1024
+
+# stateless signed download URLs for share links
+SHARE_SIGNED_URLS = os.getenv("SHARE_SIGNED_URLS") == "True"
+SHARE_SIGNED_URL_TTL = int(os.getenv("SHARE_SIGNED_URL_TTL", 300))
+SHARE_URL_SIGNING_KEY = os.getenv("SHARE_URL_SIGNING_KEY")
+
+# download governor, stream slots are kept in the shared default cache
+DOWNLOAD_MAX_STREAMS_GLOBAL = int(os.getenv("DOWNLOAD_MAX_STREAMS_GLOBAL", 200))
+DOWNLOAD_MAX_STREAMS_PER_USER = int(os.getenv("DOWNLOAD_MAX_STREAMS_PER_USER", 4))
+DOWNLOAD_MAX_STREAMS_PER_TOKEN = int(os.getenv("DOWNLOAD_MAX_STREAMS_PER_TOKEN", 2))
+# bytes per second for each stream, 0 disables the cap
+DOWNLOAD_BANDWIDTH_PER_STREAM = int(os.getenv("DOWNLOAD_BANDWIDTH_PER_STREAM", 0))
+# a stream refreshes its slots while it sends, the slots of a killed
+# worker free up after this long
+DOWNLOAD_STREAM_LEASE_SECONDS = 60
+DOWNLOAD_RETRY_AFTER = 5
+
+# in-memory cache for small hot files, 0 bytes disables it. HOT_FILE_SHARED_CACHE
+# names an entry of CACHES used as a second tier shared by all workers
+HOT_FILE_CACHE_MAX_BYTES = int(os.getenv("HOT_FILE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+HOT_FILE_CACHE_MAX_FILE_SIZE = 1024 * 1024
+HOT_FILE_SHARED_CACHE = os.getenv("HOT_FILE_SHARED_CACHE")
+
+# the sync API leaves out changes younger than this, so a transaction that
+# commits after a later one is not skipped by a cursor that moved past it
+FILE_SYNC_SETTLE_SECONDS = 2
+FILE_SYNC_MAX_CHANGES = 1000
+
+# serialized file list pages, cached per user list version
+FILE_LIST_CACHE_PAGE_SIZE = 2000
+FILE_LIST_CACHE_MAX_PAGES = 10
+FILE_LIST_CACHE_TIMEOUT = 60 * 60
+
+# files not accessed for this many days are moved to the cold tier
+FILE_COLD_AFTER_DAYS = int(os.getenv("FILE_COLD_AFTER_DAYS", 30))
@@ -0,0 +1,29 @@
+"""
+Settings for the test suite, SQLite with a second alias as the read replica.
+
+    python manage.py test files --settings=config.test_settings
+"""
+import tempfile
+from pathlib import Path
+
+from config.settings import *  # noqa: F401,F403
+
+# nothing is written to the source tree
+TEST_DB_DIR = Path(tempfile.gettempdir())
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': str(TEST_DB_DIR / 'fileshare_test.sqlite3'),
+        # threads of the upload lock test wait on each other's row locks
+        'OPTIONS': {'timeout': 60, 'transaction_mode': 'IMMEDIATE'},
+        'TEST': {'NAME': str(TEST_DB_DIR / 'fileshare_test_db.sqlite3')},
+    },
+}
+# read only, an immediate transaction would wait for the primary's write lock
+DATABASES['replica_0'] = {
+    **DATABASES['default'],
+    'OPTIONS': {'timeout': 60},
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_REPLICAS = ['replica_0']
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHES={
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register('caches', deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    list versions, signed URL revocations and download stream slots are
+    only correct when every worker sees the same cache
+    """
+    backend=settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            "The default cache is local to each process",
+            hint="Set REDIS_URL so every worker shares the default cache",
+            id='files.E001',
+        )]
+    return []
+
+
+@register('files', deploy=True)
+def check_shared_hot_tier(app_configs, **kwargs):
+    """
+    uploads are written to the hot tier, every web server has to read them
+    """
+    if not getattr(settings, 'FILE_STORAGE_HOT_ROOT', None):
+        return [Error(
+            "The hot storage tier is on the server local MEDIA_ROOT",
+            hint="Set FILE_STORAGE_HOT_ROOT to a volume mounted by every web server",
+            id='files.E002',
+        )]
+    return []
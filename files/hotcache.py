@@ -0,0 +1,91 @@
+"""
+In-process LRU of small, frequently downloaded files, keyed by checksum so
+deduplicated copies share one entry. An optional second tier in a Django
+cache (e.g. Memcached or Redis) is shared by every worker.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+
+
+class HotFileCache:
+    def __init__(self, max_bytes, max_file_size, shared_cache_alias=None):
+        self.max_bytes=max_bytes
+        self.max_file_size=max_file_size
+        self.shared_cache_alias=shared_cache_alias
+        self._entries=OrderedDict()
+        self._size=0
+        self._lock=threading.Lock()
+        self.metrics={'hits':0, 'shared_hits':0, 'misses':0, 'evictions':0}
+
+    @property
+    def shared(self):
+        if self.shared_cache_alias:
+            return caches[self.shared_cache_alias]
+        return None
+
+    def accepts(self, size):
+        return bool(self.max_bytes) and 0<size<=min(self.max_file_size, self.max_bytes)
+
+    def get(self, key):
+        with self._lock:
+            data=self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.metrics['hits']+=1
+                return data
+        if self.shared is not None:
+            data=self.shared.get(f'hotfile:{key}')
+            if data is not None:
+                with self._lock:
+                    self.metrics['shared_hits']+=1
+                self._store(key, data)
+                return data
+        with self._lock:
+            self.metrics['misses']+=1
+        return None
+
+    def put(self, key, data):
+        if not self.accepts(len(data)):
+            return
+        self._store(key, data)
+        if self.shared is not None:
+            self.shared.set(f'hotfile:{key}', data)
+
+    def _store(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key]=data
+            self._size+=len(data)
+            while self._size>self.max_bytes:
+                _, evicted=self._entries.popitem(last=False)
+                self._size-=len(evicted)
+                self.metrics['evictions']+=1
+
+    def stats(self):
+        with self._lock:
+            lookups=self.metrics['hits']+self.metrics['shared_hits']+self.metrics['misses']
+            return {
+                **self.metrics,
+                'entries':len(self._entries),
+                'bytes':self._size,
+                'max_bytes':self.max_bytes,
+                'hit_ratio':round((lookups-self.metrics['misses'])/lookups, 3) if lookups else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size=0
+
+
+hot_file_cache=SimpleLazyObject(lambda: HotFileCache(
+    max_bytes=settings.HOT_FILE_CACHE_MAX_BYTES,
+    max_file_size=settings.HOT_FILE_CACHE_MAX_FILE_SIZE,
+    shared_cache_alias=settings.HOT_FILE_SHARED_CACHE
+))
@@ -0,0 +1,100 @@
+"""
+Per-user file list versions and cached list pages.
+The version changes whenever a user's listing may change. The list ETag
+is derived from it and serialized pages are cached under it, so pages of
+an old version are never read again and simply expire. Versions must be
+seen by every worker, so this relies on a shared default cache.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from files.streaming import dumps
+
+
+def _version_key(user_id):
+    return f'files:list-version:{user_id}'
+
+
+def _pages_key(user_id, version):
+    return f'files:list:{user_id}:{version}'
+
+
+def list_version(user_id):
+    key=_version_key(user_id)
+    version=cache.get(key)
+    if version is None:
+        # an evicted version is replaced by a new one, so old ETags stop matching
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version=cache.get(key)
+    return version
+
+
+def bump_list_version(user_id):
+    """
+    give the user a new list version once the current transaction commits
+    """
+    transaction.on_commit(
+        lambda: cache.set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+    )
+
+
+def list_etag(user_id, version):
+    return f'"{user_id}-{version}"'
+
+
+def cached_list(user_id, version):
+    """
+    the cached JSON array chunks of a listing, or None when any page is missing
+    """
+    key=_pages_key(user_id, version)
+    entry=cache.get(key)
+    if entry is None:
+        return None
+    pages=[entry['first']] if entry['pages'] else []
+    if entry['pages']>1:
+        page_keys=[f'{key}:{n}' for n in range(1, entry['pages'])]
+        rest=cache.get_many(page_keys)
+        if len(rest)<len(page_keys):
+            return None
+        pages.extend(rest[page_key] for page_key in page_keys)
+    return [b'[', b','.join(pages), b']']
+
+
+def cache_list(user_id, version, rows):
+    """
+    yield a listing as a JSON array while caching it page by page.
+    The index entry is written last, so a listing cut short is never served
+    """
+    key=_pages_key(user_id, version)
+    timeout=settings.FILE_LIST_CACHE_TIMEOUT
+    max_pages=settings.FILE_LIST_CACHE_MAX_PAGES
+    yield b'['
+    pages=0
+    first=None
+    for page in _pages(rows, settings.FILE_LIST_CACHE_PAGE_SIZE):
+        if pages==0:
+            first=page
+            yield page
+        else:
+            if pages<max_pages:
+                cache.set(f'{key}:{pages}', page, timeout=timeout)
+            yield b','+page
+        pages+=1
+    # very large listings are only validated by their ETag
+    if pages<=max_pages:
+        cache.set(key, {'pages':pages, 'first':first}, timeout=timeout)
+    yield b']'
+
+
+def _pages(rows, page_size):
+    page=[]
+    for row in rows:
+        page.append(dumps(row))
+        if len(page)>=page_size:
+            yield b','.join(page)
+            page=[]
+    if page:
+        yield b','.join(page)
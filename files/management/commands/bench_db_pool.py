@@ -0,0 +1,55 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from config.mysql_pool.base import pool_stats
+
+
+class Command(BaseCommand):
+    """
+    Simulates requests against the default database with and without the
+    connection pool. Each simulated request connects, runs one query and
+    closes the connection, like a request with CONN_MAX_AGE=0.
+    """
+    help="Benchmark requests per second with and without connection pooling"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        settings_dict=connections['default'].settings_dict
+        pool_options=settings_dict.get('POOL')
+
+        settings_dict['POOL']=None
+        try:
+            direct=self._run(options['requests'], options['threads'])
+        finally:
+            settings_dict['POOL']=pool_options
+        pooled=self._run(options['requests'], options['threads'])
+
+        self.stdout.write(f"without pool: {direct:.1f} req/s")
+        self.stdout.write(f"with pool:    {pooled:.1f} req/s")
+        if direct:
+            self.stdout.write(f"speedup:      {pooled/direct:.2f}x")
+        self.stdout.write(f"pool metrics: {pool_stats()}")
+
+    def _run(self, total, threads):
+        per_thread=total//threads
+
+        def worker():
+            for _ in range(per_thread):
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                connection.close()
+
+        workers=[threading.Thread(target=worker) for _ in range(threads)]
+        started=time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return per_thread*threads/(time.perf_counter()-started)
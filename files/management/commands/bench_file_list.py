@@ -0,0 +1,67 @@
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from files.models import File, User
+from files.serializers import FilesListSerializer
+from files.services import FileService
+from files.streaming import stream_json_array
+
+
+class Command(BaseCommand):
+    """
+    Compares FilesListSerializer(many=True) with the streamed values()
+    listing on a throwaway user. Everything is rolled back afterwards.
+    """
+    help="Benchmark the file listing serializer against the streamed listing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user=self._create_rows(options['rows'])
+
+            def serializer_path():
+                files=FileService.user_list_files(user)
+                data=FilesListSerializer(files, many=True).data
+                return len(JSONRenderer().render(data))
+
+            def streaming_path():
+                rows=FileService.iter_user_files(user, FilesListSerializer.Meta.fields)
+                return sum(len(piece) for piece in stream_json_array(rows))
+
+            for label, run in (('serializer', serializer_path), ('streaming', streaming_path)):
+                tracemalloc.start()
+                started=time.perf_counter()
+                size=run()
+                elapsed=time.perf_counter()-started
+                _, peak=tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(
+                    f"{label:<10} {elapsed:.2f}s  {options['rows']/elapsed:,.0f} rows/s  "
+                    f"peak {peak/1024/1024:.1f}MB  body {size/1024/1024:.1f}MB"
+                )
+            transaction.set_rollback(True)
+
+    def _create_rows(self, count):
+        user=User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com")
+        File.objects.bulk_create(
+            (
+                File(
+                    user=user,
+                    file=f"userfiles/bench/{i}.bin",
+                    original_name=f"file-{i}.bin",
+                    file_size=i,
+                    content_type='application/octet-stream',
+                    description='benchmark row'
+                )
+                for i in range(count)
+            ),
+            batch_size=5000
+        )
+        return user
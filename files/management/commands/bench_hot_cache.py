@@ -0,0 +1,75 @@
+import os
+import secrets
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from django.utils import timezone
+
+from files.hotcache import hot_file_cache
+from files.models import File, FileShareLink, User
+from files.services import FileService
+from files.views import PublicFileAccessView
+
+
+class Command(BaseCommand):
+    """
+    Hammers one share link through PublicFileAccessView with the hot file
+    cache disabled and enabled. The throwaway user, file and share are
+    removed afterwards.
+    """
+    help="Benchmark hot share link throughput with and without the hot file cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--size', type=int, default=64, help="file size in KB")
+
+    def handle(self, *args, **options):
+        user=User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com")
+        try:
+            uploaded=FileService.upload_files(
+                user, [SimpleUploadedFile('hot.bin', os.urandom(options['size']*1024))]
+            )[0]
+            share=FileShareLink.objects.create(
+                file_id=uploaded['id'],
+                owner=user,
+                recipient_email='bench@example.com',
+                share_token=secrets.token_urlsafe(32),
+                expiration_datetime=timezone.now()+timedelta(hours=1)
+            )
+            max_bytes=hot_file_cache.max_bytes
+            for label, enabled in (('disk', False), ('hot cache', True)):
+                hot_file_cache.clear()
+                hot_file_cache.max_bytes=max_bytes if enabled else 0
+                view_rate=self._run_view(share.share_token, options['requests'])
+                open_rate=self._run_open(share.file, options['requests'])
+                self.stdout.write(
+                    f"{label:<10} view {view_rate:,.0f} req/s, open_file {open_rate:,.0f} reads/s"
+                )
+            hot_file_cache.max_bytes=max_bytes
+            self.stdout.write(f"cache metrics: {hot_file_cache.stats()}")
+        finally:
+            storage=File._meta.get_field('file').storage
+            for name in set(File.objects.filter(user=user).values_list('file', flat=True)):
+                storage.delete(name)
+            user.delete()
+
+    def _run_open(self, file_obj, count):
+        started=time.perf_counter()
+        for _ in range(count):
+            with FileService.open_file(file_obj) as handle:
+                handle.read()
+        return count/(time.perf_counter()-started)
+
+    def _run_view(self, token, count):
+        factory=RequestFactory()
+        view=PublicFileAccessView.as_view()
+        started=time.perf_counter()
+        for _ in range(count):
+            response=view(factory.get(f'/api/files/public/{token}/'), token=token)
+            b''.join(response.streaming_content)
+            response.close()
+        return count/(time.perf_counter()-started)
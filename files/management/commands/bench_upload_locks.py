@@ -0,0 +1,87 @@
+import os
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from files.models import File, User
+from files.services import FileService
+
+
+class Command(BaseCommand):
+    """
+    Runs parallel batch uploads while a probe repeatedly updates the
+    uploading user's row, the row every upload transaction locks through
+    its foreign keys. Probe latency is the lock-wait time other requests
+    see. "single transaction" wraps upload_files in an outer atomic block,
+    which is how uploads behaved before the two-phase split.
+    """
+    help="Measure lock-wait time under parallel uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--files', type=int, default=5, help="files per upload batch")
+        parser.add_argument('--size', type=int, default=20, help="file size in MB")
+
+    def handle(self, *args, **options):
+        user=User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com")
+        try:
+            for label, single_transaction in (('single transaction', True), ('two-phase', False)):
+                waits, elapsed=self._run(user, options, single_transaction)
+                self.stdout.write(
+                    f"{label:<18} uploads {elapsed:.2f}s  probe wait avg "
+                    f"{statistics.mean(waits)*1000:.1f}ms  max {max(waits)*1000:.1f}ms  "
+                    f"({len(waits)} probes)"
+                )
+        finally:
+            storage=File._meta.get_field('file').storage
+            for name in set(File.objects.filter(user=user).values_list('file', flat=True)):
+                storage.delete(name)
+            user.delete()
+
+    def _run(self, user, options, single_transaction):
+        size=options['size']*1024*1024
+        done=threading.Event()
+        waits=[]
+
+        def upload():
+            try:
+                files=[
+                    SimpleUploadedFile(f"bench-{i}.bin", os.urandom(size))
+                    for i in range(options['files'])
+                ]
+                if single_transaction:
+                    with transaction.atomic():
+                        FileService.upload_files(user, files)
+                else:
+                    FileService.upload_files(user, files)
+            finally:
+                connection.close()
+
+        def probe():
+            try:
+                while not done.is_set():
+                    started=time.perf_counter()
+                    User.objects.filter(pk=user.pk).update(last_login=timezone.now())
+                    waits.append(time.perf_counter()-started)
+                    time.sleep(0.01)
+            finally:
+                connection.close()
+
+        prober=threading.Thread(target=probe)
+        uploaders=[threading.Thread(target=upload) for _ in range(options['threads'])]
+        started=time.perf_counter()
+        prober.start()
+        for thread in uploaders:
+            thread.start()
+        for thread in uploaders:
+            thread.join()
+        elapsed=time.perf_counter()-started
+        done.set()
+        prober.join()
+        return waits, elapsed
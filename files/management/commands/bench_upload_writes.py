@@ -0,0 +1,67 @@
+import os
+import uuid
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils.module_loading import import_string
+
+from files.models import File, User
+from files.services import FileService
+
+
+def bytes_written():
+    # wchar counts every byte this process passed to write()
+    with open('/proc/self/io') as handle:
+        for line in handle:
+            if line.startswith('wchar:'):
+                return int(line.split()[1])
+    raise CommandError("/proc/self/io is not available on this platform")
+
+
+class Command(BaseCommand):
+    """
+    Measures bytes written per uploaded byte for the /tmp temp file
+    handler and the staged handler, for new and for deduplicated content.
+    Rows are rolled back and stored files removed afterwards.
+    """
+    help="Benchmark disk bytes written per uploaded byte"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=20, help="upload size in MB")
+
+    def handle(self, *args, **options):
+        size=options['size']*1024*1024
+        handler_sets={
+            'tmp copy':['django.core.files.uploadhandler.TemporaryFileUploadHandler'],
+            'staged':['files.upload_handlers.StagedFileUploadHandler'],
+        }
+        with transaction.atomic():
+            user=User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com")
+            stored=[]
+            for label, handlers in handler_sets.items():
+                content=os.urandom(size)
+                for kind in ('new', 'duplicate'):
+                    ratio=self._upload(user, content, handlers, stored)
+                    self.stdout.write(f"{label:<9} {kind:<9} {ratio:.2f} bytes written per uploaded byte")
+            transaction.set_rollback(True)
+        for name in set(stored):
+            File._meta.get_field('file').storage.delete(name)
+
+    def _upload(self, user, content, handlers, stored):
+        request=RequestFactory().post(
+            '/api/file-upload',
+            {'files':[SimpleUploadedFile('bench.bin', content)]}
+        )
+        request.upload_handlers=[import_string(path)(request) for path in handlers]
+        before=bytes_written()
+        files=request.FILES.getlist('files')
+        result=FileService.upload_files(user, files)
+        for uploaded in files:
+            uploaded.close()
+        written=bytes_written()-before
+        stored.extend(
+            File.objects.filter(id__in=[row['id'] for row in result]).values_list('file', flat=True)
+        )
+        return written/len(content)
@@ -0,0 +1,205 @@
+import base64
+import os
+import random
+import time
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from files.models import File, FileShareLink, User, file_upload_path
+
+FILE_TYPES=[
+    ('jpg', 'image/jpeg'),
+    ('png', 'image/png'),
+    ('pdf', 'application/pdf'),
+    ('txt', 'text/plain'),
+    ('docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    ('zip', 'application/zip'),
+    ('mp4', 'video/mp4'),
+]
+
+
+class Command(BaseCommand):
+    """
+    Bulk generates users, files and share links for scale testing.
+    Rows are written with bulk_create in batches, and all users share one
+    password hash, so no PBKDF2 runs per user. Blobs are sparse files of
+    the recorded size. Their checksums are synthetic, so scrub_files
+    reports them as mismatched. The same seed produces the same rows,
+    apart from timestamps.
+    """
+    help="Generate a synthetic dataset of users, files and shares"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--files-per-user', type=float, default=50,
+                            help="mean, counts are exponentially distributed")
+        parser.add_argument('--size-median', type=int, default=256, help="median file size in KB")
+        parser.add_argument('--size-sigma', type=float, default=1.5,
+                            help="log-normal spread of file sizes, 0 gives every file the median size")
+        parser.add_argument('--max-size', type=int, default=100, help="largest file size in MB")
+        parser.add_argument('--dedup-ratio', type=float, default=0.2,
+                            help="fraction of files that reuse earlier content")
+        parser.add_argument('--dedup-pool', type=int, default=100000,
+                            help="number of distinct contents kept as dedup candidates")
+        parser.add_argument('--deleted-ratio', type=float, default=0.05)
+        parser.add_argument('--share-ratio', type=float, default=0.1,
+                            help="fraction of files with a share link")
+        parser.add_argument('--share-expiry', type=float, nargs=2, default=[-72, 168],
+                            metavar=('MIN', 'MAX'),
+                            help="share expiration spread in hours from now, negative is already expired")
+        parser.add_argument('--password', default=None,
+                            help="password of every user, unusable when omitted")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-blobs', action='store_true', help="write database rows only")
+
+    def handle(self, *args, **options):
+        self.options=options
+        self.rng=random.Random(options['seed'])
+        self.field=File._meta.get_field('file')
+        self.blob_storage=getattr(self.field.storage, 'hot', self.field.storage)
+        self.now=timezone.now()
+        self.pool=[]
+        self.counts={'users':0, 'files':0, 'shares':0, 'blobs':0, 'bytes':0}
+
+        self.prefix=f"synthetic-{options['seed']}-"
+        if User.objects.filter(email__startswith=self.prefix).exists():
+            raise CommandError(f"A dataset for seed {options['seed']} already exists")
+        # hashed once and shared by every generated user
+        self.password=make_password(options['password'])
+
+        mean=options['files_per_user']
+        users_per_batch=max(1, int(options['batch_size']/(mean+1)))
+        started=time.perf_counter()
+        for start in range(0, options['users'], users_per_batch):
+            self._generate_batch(start, min(start+users_per_batch, options['users']))
+            elapsed=time.perf_counter()-started
+            rows=self.counts['users']+self.counts['files']+self.counts['shares']
+            self.stdout.write(
+                f"{self.counts['users']} users, {self.counts['files']} files, "
+                f"{self.counts['shares']} shares ({rows/elapsed:,.0f} rows/s)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {self.counts['users']} users, {self.counts['files']} files, "
+            f"{self.counts['shares']} shares, {self.counts['blobs']} blobs "
+            f"({self.counts['bytes']/1024**3:.1f} GB apparent size)"
+        ))
+
+    def _generate_batch(self, start, end):
+        batch_size=self.options['batch_size']
+        users=[]
+        plans=[]
+        for n in range(start, end):
+            specs=[self._file_spec() for _ in range(self._file_count())]
+            users.append(User(
+                email=f"{self.prefix}{n}@example.com",
+                password=self.password,
+                first_name=f"User {n}",
+                storage_used=sum(spec['file_size'] for spec in specs if not spec['is_deleted'])
+            ))
+            plans.append(specs)
+
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=batch_size)
+            # MySQL does not return auto increment ids from bulk_create
+            user_ids=dict(
+                User.objects.filter(email__in=[user.email for user in users])
+                .values_list('email', 'id')
+            )
+            files=[]
+            shares=[]
+            for user, specs in zip(users, plans):
+                user_id=user_ids[user.email]
+                for spec in specs:
+                    files.append(File(user_id=user_id, **spec))
+                    if self.rng.random()<self.options['share_ratio']:
+                        shares.append(self._share(spec['id'], user_id))
+            File.objects.bulk_create(files, batch_size=batch_size)
+            FileShareLink.objects.bulk_create(shares, batch_size=batch_size)
+
+        self.counts['users']+=len(users)
+        self.counts['files']+=len(files)
+        self.counts['shares']+=len(shares)
+
+    def _file_count(self):
+        mean=self.options['files_per_user']
+        if mean<=0:
+            return 0
+        return int(self.rng.expovariate(1/mean))
+
+    def _file_spec(self):
+        content=self._content()
+        ext=content['ext']
+        return {
+            'id':self._uuid(),
+            'file':content['name'],
+            'original_name':f"file-{self.rng.getrandbits(32):08x}.{ext}",
+            'file_size':content['size'],
+            'content_type':content['content_type'],
+            'checksum':content['checksum'],
+            'is_deleted':self.rng.random()<self.options['deleted_ratio'],
+        }
+
+    def _content(self):
+        """
+        earlier content for the dedup ratio, otherwise new content with its blob
+        """
+        if self.pool and self.rng.random()<self.options['dedup_ratio']:
+            return self.rng.choice(self.pool)
+
+        ext, content_type=self.rng.choice(FILE_TYPES)
+        checksum=f"{self.rng.getrandbits(128):032x}"
+        content={
+            'checksum':checksum,
+            # the upload path of a File with this checksum, without building one
+            'name':self.field.storage.generate_filename(
+                file_upload_path(SimpleNamespace(checksum=checksum), f"blob.{ext}")
+            ),
+            'size':self._size(),
+            'ext':ext,
+            'content_type':content_type,
+        }
+        if len(self.pool)<self.options['dedup_pool']:
+            self.pool.append(content)
+        else:
+            self.pool[self.rng.randrange(len(self.pool))]=content
+        if not self.options['no_blobs']:
+            self._write_sparse(content['name'], content['size'])
+        return content
+
+    def _size(self):
+        median=self.options['size_median']*1024
+        size=int(median*self.rng.lognormvariate(0, self.options['size_sigma']))
+        return max(1, min(size, self.options['max_size']*1024*1024))
+
+    def _write_sparse(self, name, size):
+        path=self.blob_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.truncate(size)
+        self.counts['blobs']+=1
+        self.counts['bytes']+=size
+
+    def _share(self, file_id, owner_id):
+        low, high=self.options['share_expiry']
+        return FileShareLink(
+            id=self._uuid(),
+            file_id=file_id,
+            owner_id=owner_id,
+            recipient_email=f"recipient-{self.rng.randrange(1000000)}@example.com",
+            share_token=base64.urlsafe_b64encode(
+                self.rng.getrandbits(256).to_bytes(32, 'big')
+            ).rstrip(b'=').decode(),
+            expiration_datetime=self.now+timedelta(hours=self.rng.uniform(low, high)),
+            is_active=self.rng.random()>=0.05
+        )
+
+    def _uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from files.models import Chunk, File
+from files.throttling import TokenBucket
+
+HASH_SLICE_SIZE=1024*1024
+
+
+class Command(BaseCommand):
+    """
+    Re-hashes stored blobs and compares them with the recorded checksums.
+    Blobs shared by deduplicated rows and chunks shared by chunked files are
+    hashed once. Progress is checkpointed after every batch, so a stopped
+    scrub continues where it left off.
+    """
+    help="Verify stored files against their checksums"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--rate-limit', type=float, default=50,
+                            help="combined read rate in MB/s, 0 disables the limit")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--checkpoint', default=str(settings.BASE_DIR/'.scrub_checkpoint'))
+        parser.add_argument('--restart', action='store_true',
+                            help="ignore the checkpoint and scrub everything")
+
+    def handle(self, *args, **options):
+        self.storage=getattr(default_storage, 'hot', default_storage)
+        self.limiter=TokenBucket(int(options['rate_limit']*1024*1024))
+        self.checkpoint_path=options['checkpoint']
+        checkpoint={} if options['restart'] else self._load_checkpoint()
+
+        self.verified=self.mismatched=self.missing=self.unreadable=0
+        # a resumed scrub keeps the start of the run it continues, chunks
+        # verified before the stop still count
+        self.started=(
+            datetime.fromisoformat(checkpoint['started']) if 'started' in checkpoint else timezone.now()
+        )
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            self.pool=pool
+            last=checkpoint.get('last', '')
+            if checkpoint.get('phase', 'files')=='files':
+                self._scrub_files(last, options['batch_size'])
+                last=''
+            self._scrub_chunks(last, options['batch_size'])
+
+        # a chunked file is verified once every chunk it references is
+        File.objects.filter(is_chunked=True).exclude(
+            chunks__chunk__last_verified_at__isnull=True
+        ).exclude(
+            chunks__chunk__last_verified_at__lt=self.started
+        ).update(last_verified_at=timezone.now())
+
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        summary=(
+            f"{self.verified} verified, {self.mismatched} mismatched, "
+            f"{self.missing} missing, {self.unreadable} unreadable"
+        )
+        if self.mismatched or self.missing or self.unreadable:
+            self.stdout.write(self.style.ERROR(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def _scrub_files(self, last, batch_size):
+        while True:
+            # one entry per stored blob, deduplicated rows share it
+            batch=list(
+                File.objects.filter(is_chunked=False, storage_tier=File.TIER_HOT, file__gt=last)
+                .values('file')
+                .annotate(checksum=Max('checksum'))
+                .order_by('file')[:batch_size]
+            )
+            if not batch:
+                return
+            jobs=[(row['file'], row['checksum'], hashlib.md5) for row in batch]
+            verified=self._verify_batch(jobs)
+            File.objects.filter(file__in=verified).update(last_verified_at=timezone.now())
+            last=batch[-1]['file']
+            self._save_checkpoint('files', last)
+
+    def _scrub_chunks(self, last, batch_size):
+        while True:
+            batch=list(
+                Chunk.objects.filter(digest__gt=last)
+                .order_by('digest')
+                .values_list('digest', 'blob')[:batch_size]
+            )
+            if not batch:
+                return
+            jobs=[(blob, digest, hashlib.sha256) for digest, blob in batch]
+            verified=self._verify_batch(jobs)
+            Chunk.objects.filter(blob__in=verified).update(last_verified_at=timezone.now())
+            last=batch[-1][0]
+            self._save_checkpoint('chunks', last)
+
+    def _verify_batch(self, jobs):
+        verified=[]
+        for name, expected, actual, error in self.pool.map(self._verify, jobs):
+            if error is not None:
+                self.unreadable+=1
+                self.stderr.write(f"UNREADABLE {name}: {error}")
+            elif actual is None:
+                self.missing+=1
+                self.stderr.write(f"MISSING {name}")
+            elif expected and actual!=expected:
+                self.mismatched+=1
+                self.stderr.write(f"MISMATCH {name}: expected {expected}, got {actual}")
+            else:
+                self.verified+=1
+                verified.append(name)
+        return verified
+
+    def _verify(self, job):
+        name, expected, hash_factory=job
+        try:
+            return name, expected, self._hash(self.storage.path(name), hash_factory), None
+        except FileNotFoundError:
+            return name, expected, None, None
+        except OSError as e:
+            # bad media or permissions on one blob must not stop the scrub
+            return name, expected, None, e
+        finally:
+            connection.close()
+
+    def _hash(self, path, hash_factory):
+        digest=hash_factory()
+        with open(path, 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size==0:
+                return digest.hexdigest()
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    for start in range(0, len(mapped), HASH_SLICE_SIZE):
+                        with view[start:start+HASH_SLICE_SIZE] as piece:
+                            self.limiter.consume(len(piece))
+                            digest.update(piece)
+        return digest.hexdigest()
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as handle:
+                return json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_checkpoint(self, phase, last):
+        tmp_path=f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as handle:
+            json.dump({'phase':phase, 'last':last, 'started':self.started.isoformat()}, handle)
+        os.replace(tmp_path, self.checkpoint_path)
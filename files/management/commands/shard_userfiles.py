@@ -0,0 +1,112 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from files.models import File
+from files.storage import ShardedFileSystemStorage
+
+
+class Command(BaseCommand):
+    """
+    Moves files stored in the legacy userfiles/user_<id>/<uuid>/<filename>
+    layout into the sharded layout and rewrites File.file.
+    Progress is derived from the database, so an interrupted run can
+    simply be started again.
+    """
+    help="Move stored files into the sharded userfiles layout"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        self.field=File._meta.get_field('file')
+        self.storage=getattr(self.field.storage, 'hot', self.field.storage)
+        if not isinstance(self.storage, ShardedFileSystemStorage):
+            raise CommandError("Default storage is not a ShardedFileSystemStorage")
+        self.dry_run=options['dry_run']
+
+        moved=failed=0
+        last_name=''
+        while True:
+            # several rows share one path after dedup, so walk distinct paths
+            names=list(
+                File.objects.filter(file__gt=last_name, is_chunked=False)
+                .order_by('file')
+                .values_list('file', flat=True)
+                .distinct()[:options['batch_size']]
+            )
+            if not names:
+                break
+            last_name=names[-1]
+            pending=[name for name in names if not self.storage.is_sharded(name)]
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                for ok in pool.map(self._move, pending):
+                    if ok:
+                        moved+=1
+                    else:
+                        failed+=1
+            self.stdout.write(f"{moved} moved, {failed} failed (at {last_name})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {moved} moved, {failed} failed"))
+
+    def _move(self, old_name):
+        try:
+            return self._move_file(old_name)
+        except OSError as e:
+            self.stderr.write(f"{old_name}: {e}")
+            return False
+        finally:
+            connection.close()
+
+    def _move_file(self, old_name):
+        row=File.objects.filter(file=old_name).values('id', 'checksum').first()
+        if row is None:
+            return True
+        new_name=self.field.generate_filename(
+            File(id=row['id'], checksum=row['checksum']),
+            os.path.basename(old_name)
+        )
+        src=self.storage.path(old_name)
+        dst=self.storage.path(new_name)
+        if self.dry_run:
+            self.stdout.write(f"{old_name} -> {new_name}")
+            return True
+
+        if not os.path.exists(src):
+            if not os.path.exists(dst):
+                self.stderr.write(f"{old_name}: missing on disk")
+                return False
+            # an earlier run placed the file but did not update the rows
+        else:
+            if os.path.exists(dst) and os.path.getsize(dst)!=os.path.getsize(src):
+                new_name=self.storage.get_available_name(new_name)
+                dst=self.storage.path(new_name)
+            if not os.path.exists(dst):
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copy2(src, dst)
+
+        with transaction.atomic():
+            File.objects.filter(file=old_name).update(file=new_name)
+
+        if os.path.exists(src):
+            os.remove(src)
+            self._prune_empty_dirs(os.path.dirname(src))
+        return True
+
+    def _prune_empty_dirs(self, path):
+        root=os.path.abspath(self.storage.location)
+        path=os.path.abspath(path)
+        while path.startswith(root) and path!=root:
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+            path=os.path.dirname(path)
@@ -0,0 +1,84 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from files.models import Chunk, File, StagedUpload
+from files.upload_handlers import staging_directory
+
+
+class Command(BaseCommand):
+    """
+    Cleans up after uploads that never committed: blobs written by the
+    first phase of FileService.upload_files without File rows, chunks no
+    file references, and upload spools left in the staging directory by
+    killed workers.
+    """
+    help="Remove staged upload blobs that were never committed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=float, default=6)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        max_age=timedelta(hours=options['older_than_hours'])
+        cutoff=timezone.now()-max_age
+        storage=File._meta.get_field('file').storage
+        dry_run=options['dry_run']
+
+        removed_blobs=0
+        for staged in StagedUpload.objects.filter(created_at__lt=cutoff).iterator():
+            # another upload may have committed rows pointing at the same name
+            if not File.objects.filter(file=staged.blob).exists():
+                if not dry_run:
+                    storage.delete(staged.blob)
+                removed_blobs+=1
+            if not dry_run:
+                staged.delete()
+
+        removed_chunks=self._sweep_chunks(cutoff, storage, options['batch_size'], dry_run)
+
+        removed_spools=0
+        spool_cutoff=time.time()-max_age.total_seconds()
+        with os.scandir(staging_directory()) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime<spool_cutoff:
+                    if not dry_run:
+                        os.remove(entry.path)
+                    removed_spools+=1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{removed_blobs} uncommitted blobs, {removed_chunks} orphaned chunks and "
+            f"{removed_spools} stale spools removed"
+        ))
+
+    def _sweep_chunks(self, cutoff, storage, batch_size, dry_run):
+        """
+        chunks are written before the upload transaction, one that never
+        committed leaves them without any FileChunk
+        """
+        removed=0
+        last=''
+        while True:
+            digests=list(
+                Chunk.objects.filter(digest__gt=last, created_at__lt=cutoff, file_chunks__isnull=True)
+                .order_by('digest')
+                .values_list('digest', flat=True)[:batch_size]
+            )
+            if not digests:
+                return removed
+            last=digests[-1]
+            if dry_run:
+                removed+=len(digests)
+                continue
+            blobs=dict(Chunk.objects.filter(digest__in=digests).values_list('digest', 'blob'))
+            # re-checked in the DELETE, an upload may have just referenced one
+            Chunk.objects.filter(digest__in=digests, file_chunks__isnull=True).delete()
+            kept=set(Chunk.objects.filter(digest__in=digests).values_list('digest', flat=True))
+            for digest, blob in blobs.items():
+                if digest not in kept:
+                    storage.delete(blob)
+                    removed+=1
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from files.models import File
+from files.storage import TieredStorage
+
+
+class Command(BaseCommand):
+    """
+    Moves stored files that nobody accessed in the last N days from the
+    hot filesystem tier to the cold object tier.
+    A blob shared by several rows only moves when all of them are stale.
+    """
+    help="Move files not accessed in N days to the cold storage tier"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.FILE_COLD_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage=File._meta.get_field('file').storage
+        if not isinstance(storage, TieredStorage) or storage.cold is None:
+            raise CommandError("No cold storage tier is configured")
+
+        cutoff=timezone.now()-timedelta(days=options['days'])
+        stale=(
+            File.objects.filter(storage_tier=File.TIER_HOT, is_chunked=False)
+            .values('file')
+            .annotate(last_used=Max(Coalesce('last_accessed_at', 'created_at')))
+            .filter(last_used__lt=cutoff)
+            .order_by('file')
+            .values_list('file', flat=True)
+        )
+
+        moved=0
+        for name in stale.iterator(chunk_size=options['batch_size']):
+            if options['dry_run']:
+                self.stdout.write(f"would move {name}")
+                continue
+            storage.move_to_cold(name)
+            File.objects.filter(file=name).update(storage_tier=File.TIER_COLD)
+            moved+=1
+
+        self.stdout.write(self.style.SUCCESS(f"{moved} files moved to cold storage"))
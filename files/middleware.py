@@ -0,0 +1,42 @@
+from django.core.cache import cache
+
+from files.routers import (
+    lag_tolerance, pinned_until, request_user_id, reset_pin, restore_pin, user_pin_key
+)
+
+
+class PrimaryPinningMiddleware:
+    """
+    Carries the read-your-writes pin across requests, so a client that
+    just wrote keeps reading from the primary until the replicas have
+    caught up. Authenticated users are pinned in the shared cache, which
+    covers token clients, the cookie covers everyone else.
+    """
+    cookie_name='db_pin'
+
+    def __init__(self, get_response):
+        self.get_response=get_response
+
+    def __call__(self, request):
+        try:
+            until=float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            until=0.0
+        tokens=reset_pin(until, request)
+        try:
+            response=self.get_response(request)
+            if pinned_until()>until:
+                # DRF sets the authenticated user on the Django request
+                user_id=request_user_id(request)
+                if user_id is not None:
+                    cache.set(user_pin_key(user_id), pinned_until(), timeout=lag_tolerance())
+                response.set_cookie(
+                    self.cookie_name,
+                    f"{pinned_until():.3f}",
+                    max_age=lag_tolerance(),
+                    httponly=True,
+                    samesite='Lax'
+                )
+            return response
+        finally:
+            restore_pin(tokens)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.11 on 2026-10-19 02:10
+
+import files.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_alter_filesharelink_expiration_datetime'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(upload_to=files.models.file_upload_path),
+        ),
+    ]
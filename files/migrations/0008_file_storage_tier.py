@@ -0,0 +1,27 @@
+# Generated by Django 5.2.11 on 2026-10-19 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_alter_file_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='last_accessed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='storage_tier',
+            field=models.CharField(choices=[('hot', 'Hot'), ('cold', 'Cold')], default='hot', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['storage_tier', 'last_accessed_at'], name='files_file_storage_1ccf0f_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-19 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_chunk_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='last_verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='last_verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-19 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_last_verified_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filesharelink',
+            index=models.Index(fields=['owner', 'created_at'], name='files_files_owner_i_c755be_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-19 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0012_stagedupload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='files_file_user_id_16cf70_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.11 on 2026-10-19 02:27
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_storage_used(apps, schema_editor):
+    User=apps.get_model('files', 'User')
+    File=apps.get_model('files', 'File')
+    usage=(
+        File.objects.filter(user=models.OuterRef('pk'), is_deleted=False)
+        .values('user')
+        .annotate(total=models.Sum('file_size'))
+        .values('total')
+    )
+    User.objects.update(storage_used=Coalesce(models.Subquery(usage), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0013_file_sync_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='storage_used',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_storage_used, migrations.RunPython.noop),
+    ]
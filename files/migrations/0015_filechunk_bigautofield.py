@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-19 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0014_user_storage_used'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='filechunk',
+            name='id',
+            field=models.BigAutoField(primary_key=True, serialize=False),
+        ),
+    ]
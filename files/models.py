@@ -1,4 +1,5 @@
 from django.db import models
+import os
 import uuid
 from django.conf import settings
 from django.contrib.auth.models import BaseUserManager, AbstractUser
@@ -32,6 +33,8 @@ class User(AbstractUser):
     username=None
     email=models.EmailField(unique=True)
     date_of_birth=models.DateField(null=True, blank=True)
+    # bytes of the user's files that are not deleted, kept by FileService
+    storage_used=models.BigIntegerField(default=0)
     USERNAME_FIELD='email'
     REQUIRED_FIELDS=['first_name', 'date_of_birth']
     objects=UserManager()
@@ -45,14 +48,30 @@ def user_directory_path(instance, filename):
     return f"userfiles/user_{instance.user.id}/{instance.id}/{filename}"
 
 
+def file_upload_path(instance, filename):
+    """
+    Files uploaded to: media/userfiles/<ab>/<cd>/<checksum><ext>
+    the shard directories are added by the storage backend
+    """
+    key=instance.checksum or instance.id.hex
+    ext=os.path.splitext(filename)[1].lower()
+    return f"userfiles/{key}{ext}"
+
+
 class File(models.Model):
+    TIER_HOT='hot'
+    TIER_COLD='cold'
+    TIER_CHOICES=[
+        (TIER_HOT, 'Hot'),
+        (TIER_COLD, 'Cold'),
+    ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name="files"
     )
-    file = models.FileField(upload_to=user_directory_path)
+    file = models.FileField(upload_to=file_upload_path, blank=True)
     original_name = models.CharField(max_length=255)
     file_size = models.BigIntegerField()
     content_type = models.CharField(max_length=100)
@@ -61,10 +80,74 @@ class File(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_deleted = models.BooleanField(default=False)
+    storage_tier=models.CharField(max_length=10, choices=TIER_CHOICES, default=TIER_HOT)
+    last_accessed_at=models.DateTimeField(blank=True, null=True)
+    # chunked files have no blob of their own, see FileChunk
+    is_chunked=models.BooleanField(default=False)
+    last_verified_at=models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes=[
+            models.Index(fields=['storage_tier', 'last_accessed_at']),
+            # keyset scans of the sync API
+            models.Index(fields=['user', 'updated_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.original_name} - {self.user.email}"
 
+class Chunk(models.Model):
+    """
+    content-defined chunk stored once and shared by every file containing it
+    """
+    digest=models.CharField(max_length=64, primary_key=True)
+    size=models.IntegerField()
+    blob=models.CharField(max_length=255)
+    created_at=models.DateTimeField(auto_now_add=True)
+    last_verified_at=models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return self.digest
+
+
+class FileChunk(models.Model):
+    # one row per chunk of every chunked file
+    id=models.BigAutoField(primary_key=True)
+    file=models.ForeignKey(
+        'File',
+        on_delete=models.CASCADE,
+        related_name='chunks',
+        db_index=True
+    )
+    chunk=models.ForeignKey(
+        'Chunk',
+        on_delete=models.PROTECT,
+        related_name='file_chunks',
+        db_index=True
+    )
+    position=models.PositiveIntegerField()
+    offset=models.BigIntegerField()
+
+    class Meta:
+        ordering=['position']
+        constraints=[
+            models.UniqueConstraint(fields=['file', 'position'], name='unique_file_chunk_position'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_id} #{self.position}"
+
+class StagedUpload(models.Model):
+    """
+    blob written to storage whose File rows have not been committed yet
+    """
+    id=models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    blob=models.CharField(max_length=255, db_index=True)
+    created_at=models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.blob
+
 class FileShareLink(models.Model):
     id=models.UUIDField(
         primary_key=True,
@@ -95,5 +178,10 @@ class FileShareLink(models.Model):
     accessed_at=models.DateTimeField(blank=True, null=True)
     is_active=models.BooleanField(default=True)
 
+    class Meta:
+        indexes=[
+            models.Index(fields=['owner', 'created_at']),
+        ]
+
     def __str__(self):
         return f"{self.file} shared with {self.recipient_email}"
\ No newline at end of file
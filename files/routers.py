@@ -0,0 +1,108 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# wall clock time until which reads of the current request go to the primary
+_pinned_until=ContextVar('pinned_until', default=0.0)
+# the request being served, its user's pin is looked up in the cache
+_request=ContextVar('request', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def lag_tolerance():
+    """
+    seconds a replica may trail the primary, reads stay on the primary
+    for that long after a write
+    """
+    return getattr(settings, 'DATABASE_REPLICA_LAG_TOLERANCE', 5)
+
+
+def pin_primary(until=None):
+    if until is None:
+        until=time.time()+lag_tolerance()
+    _pinned_until.set(max(until, _pinned_until.get()))
+
+
+def pinned_until():
+    return _pinned_until.get()
+
+
+def is_pinned():
+    return _pinned_until.get()>time.time()
+
+
+def reset_pin(until=0.0, request=None):
+    return _pinned_until.set(until), _request.set(request)
+
+
+def restore_pin(tokens):
+    pin_token, request_token=tokens
+    _pinned_until.reset(pin_token)
+    _request.reset(request_token)
+
+
+def user_pin_key(user_id):
+    return f'db:pin:user:{user_id}'
+
+
+def request_user_id(request):
+    user=getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+def _user_pinned():
+    """
+    pin left in the cache by an earlier request of the same user, token
+    authenticated clients send no cookies. Looked up once per request
+    """
+    request=_request.get()
+    user_id=request_user_id(request)
+    if user_id is None or getattr(request, '_db_pin_checked', False):
+        return False
+    request._db_pin_checked=True
+    until=cache.get(user_pin_key(user_id))
+    if until is None:
+        return False
+    pin_primary(until)
+    return is_pinned()
+
+
+def read_db():
+    """
+    database alias for read-only service paths: a replica unless the
+    caller wrote recently and the replicas may not have caught up yet
+    """
+    replicas=replica_aliases()
+    if not replicas or is_pinned() or _user_pinned():
+        return DEFAULT_DB_ALIAS
+    return random.choice(replicas)
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes go to the primary and pin the request to it (read-your-writes).
+    Plain reads are left to Django's defaults, read-only service paths opt
+    in to replicas through read_db().
+    """
+    def db_for_read(self, model, **hints):
+        return None
+
+    def db_for_write(self, model, **hints):
+        pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db==DEFAULT_DB_ALIAS
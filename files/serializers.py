@@ -1,9 +1,14 @@
 from .models import User, File, FileShareLink
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+from files.routers import read_db
+from files.services import FileService
+from files.sync import decode_cursor, InvalidCursor
+from django.conf import settings
 
 class RegisterSerializer(serializers.ModelSerializer):
     confirm_password=serializers.CharField(write_only=True, min_length=8)
@@ -62,12 +67,12 @@ class FileUploadSerialzier(serializers.Serializer):
     )
     
     def validate_files(self, files):
-        max_file_size=100*1024*1024
+        max_file_size=settings.FILE_MAX_UPLOAD_SIZE
         
         for file in files:
             if file.size>max_file_size:
                 raise serializers.ValidationError(
-                    f"File '{file.name} exceeds maximum size of 100MB"
+                    f"File '{file.name} exceeds maximum size of {max_file_size//(1024*1024)}MB"
                 )
         return files
     
@@ -76,13 +81,8 @@ class FileUploadSerialzier(serializers.Serializer):
         files=data.get('files', [])
         
         total_upload_size=sum(file.size for file in files)
-        current_usage=File.objects.filter(user=user).aggregate(
-            total=models.Sum('file_size')
-        )['total'] or 0
-        
-        max_storage=1 * 1024 * 1024 * 1024 
-        if total_upload_size+current_usage>max_storage:
-            available_storage=max_storage-current_usage
+        available_storage=FileService.remaining_storage(user)
+        if total_upload_size>available_storage:
             raise serializers.ValidationError(
                 f"Insufficient storage space. Only {available_storage} left. Try deleting some files!"
             )
@@ -100,6 +100,45 @@ class FilesListSerializer(serializers.ModelSerializer):
             'created_at'
         ]
 
+class BulkFileFilterSerializer(serializers.Serializer):
+    content_type=serializers.CharField(max_length=100, required=False)
+    created_after=serializers.DateTimeField(required=False)
+    created_before=serializers.DateTimeField(required=False)
+
+class BulkFileActionSerializer(serializers.Serializer):
+    """
+    files picked either by ids or by a filter with at least one condition
+    """
+    ids=serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=1000,
+        required=False
+    )
+    filter=BulkFileFilterSerializer(required=False)
+
+    def validate(self, data):
+        if ('ids' in data)==('filter' in data):
+            raise serializers.ValidationError("Provide either ids or filter")
+        if 'filter' in data and not data['filter']:
+            raise serializers.ValidationError("filter needs at least one condition")
+        return data
+
+class FileChangesQuerySerializer(serializers.Serializer):
+    cursor=serializers.CharField(required=False)
+    limit=serializers.IntegerField(
+        min_value=1,
+        max_value=settings.FILE_SYNC_MAX_CHANGES,
+        default=500
+    )
+
+    def validate_cursor(self, value):
+        try:
+            self.position=decode_cursor(value)
+        except InvalidCursor as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
 class FileShareCreateSerializer(serializers.Serializer):
     recipient_email=serializers.EmailField()
     expiration_datetime=serializers.IntegerField(min_value=1, max_value=168)
@@ -124,7 +163,7 @@ class FileShareSerializer(serializers.ModelSerializer):
     """
     serializer for viewing the shared files
     """
-    file_name=serializers.CharField(source='files.filename', read_only=True)
+    file_name=serializers.CharField(source='file.original_name', read_only=True)
     file_size=serializers.IntegerField(source='file.file_size', read_only=True)
     owner_email = serializers.EmailField(source='owner.email', read_only=True)
     is_expired = serializers.SerializerMethodField()
@@ -142,11 +181,27 @@ class FileShareSerializer(serializers.ModelSerializer):
         return timezone.now()>obj.expiration_datetime
     def get_share_url(self, obj):
         request=self.context.get('request')
+        url=reverse('files:public-file-access', args=[obj.share_token])
         if request:
-            return request.build_absolute_uri(f'/api/share/{obj.share_token}/')
-        return f'/api/share/{obj.share_token}/'
+            return request.build_absolute_uri(url)
+        return url
     
 
+class ShareFilterSerializer(serializers.Serializer):
+    """
+    query filters for the owner share dashboard
+    """
+    status=serializers.ChoiceField(choices=['active', 'expired', 'revoked'], required=False)
+    accessed=serializers.BooleanField(required=False, allow_null=True, default=None)
+    file=serializers.UUIDField(required=False)
+
+class ShareRevokeSerializer(serializers.Serializer):
+    ids=serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=1000
+    )
+
 class PublicFileSerializer(serializers.Serializer):
     token=serializers.CharField()
 
@@ -154,12 +209,13 @@ class PublicFileSerializer(serializers.Serializer):
         """
         validate whether the share object exists and is active
         """
-        try:
-            share=FileShareLink.objects.select_related('file').get(
-                share_token=value,
-                is_active=True
-            )
-        except FileShareLink.DoesNotExist:
+        shares=FileShareLink.objects.select_related('file').filter(share_token=value, is_active=True)
+        db=read_db()
+        share=shares.using(db).first()
+        if share is None and db!=DEFAULT_DB_ALIAS:
+            # a link shared a moment ago may not have reached the replica yet
+            share=shares.using(DEFAULT_DB_ALIAS).first()
+        if share is None:
             raise serializers.ValidationError("Invalid or the link have expired")
         if timezone.now() > share.expiration_datetime:
             raise serializers.ValidationError("Share link have expired")
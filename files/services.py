@@ -1,8 +1,9 @@
 from django.contrib.auth import get_user_model
-from .models import User, File, FileShareLink
-from django.db import transaction, IntegrityError
+from .models import User, File, FileShareLink, Chunk, FileChunk, StagedUpload
+from django.db import models, transaction, IntegrityError, DEFAULT_DB_ALIAS
 from rest_framework_simplejwt.tokens import RefreshToken
 import hashlib
+import io
 from typing import List
 from django.http import FileResponse
 from django.shortcuts import get_object_or_404
@@ -11,6 +12,14 @@ from django.utils import timezone
 from datetime import timedelta
 from django.core.mail import send_mail
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from files.routers import read_db
+from files.chunking import iter_chunks, ChunkedFileReader
+from files import signing
+from files.hotcache import hot_file_cache
+from files.sync import encode_cursor
+from files.listcache import bump_list_version
 
 def create_user(validated_data):
     email=validated_data.get('email')
@@ -22,12 +31,21 @@ def create_user(validated_data):
     except IntegrityError:
         raise ValueError("Unable to create user. Please try again")
     
+def user_is_active(user_id):
+    return User.objects.filter(pk=user_id, is_active=True).exists()
+
 class AuthenticationError(Exception):
     """
     Custom exception for authentication failures
     """
     pass
     
+class QuotaExceeded(Exception):
+    """
+    Raised when restoring files would exceed the user's storage quota
+    """
+    pass
+
 def authenticate_and_generate_token(email:str, password:str)->dict:
     try:
         user=User.objects.get(email=email)
@@ -54,35 +72,61 @@ class FileService:
     user-scoped listing, and soft deletion.
     """
     @staticmethod
-    @transaction.atomic
     def upload_files(user, files:List, description=None):
-        uploaded_files=[]
+        """
+        Two-phase upload: bytes are hashed and written to storage outside any
+        transaction, then all metadata is committed in one short transaction.
+        Blobs whose rows never commit are tracked by StagedUpload and removed
+        by the sweep_staged_uploads command.
+        """
+        pending=[]
+        manifests=[]
+        staged_ids=[]
+        # content seen earlier in this batch isn't committed yet
+        batch={}
         for file_obj in files:
-            checksum=FileService._calculate_checksum(file_obj)
-            existing_file=File.objects.filter(checksum=checksum).first()
+            # staged uploads were hashed while they were received
+            checksum=getattr(file_obj, 'checksum', None) or FileService._calculate_checksum(file_obj)
+            file_instance=File(
+                user=user,
+                original_name=file_obj.name,
+                description=description,
+                file_size=file_obj.size,
+                content_type=file_obj.content_type,
+                checksum=checksum
+            )
+            existing_file=batch.get(checksum) or File.objects.filter(checksum=checksum).first()
             if existing_file:
-                file_instance=File.objects.create(
-                    user=user,
-                    file=existing_file.file,
-                    original_name=file_obj.name,
-                    description=description,
-                    file_size=file_obj.size,
-                    content_type=file_obj.content_type,
-                    checksum=checksum
-                )
+                file_instance.file=existing_file.file.name
+                file_instance.storage_tier=existing_file.storage_tier
+                file_instance.is_chunked=existing_file.is_chunked
+                if existing_file.is_chunked:
+                    manifest=ChunkDedupService.copy_manifest(
+                        existing_file, file_instance, pending_manifest=manifests
+                    )
+                    manifests.extend(manifest)
                 is_duplicate=True
+            elif ChunkDedupService.should_chunk(file_obj):
+                file_instance.is_chunked=True
+                manifests.extend(ChunkDedupService.store(file_instance, file_obj))
+                is_duplicate=False
             else:
-                file_instance=File.objects.create(
-                    user=user,
-                    file=file_obj,
-                    original_name=file_obj.name,
-                    description=description,
-                    file_size=file_obj.size,
-                    content_type=file_obj.content_type,
-                    checksum=checksum
-                )
+                staged_ids.append(FileService._stage_blob(file_instance, file_obj).pk)
                 is_duplicate=False
-            uploaded_files.append({
+            batch.setdefault(checksum, file_instance)
+            pending.append((file_instance, is_duplicate))
+
+        with transaction.atomic():
+            # the counter goes first, its row lock keeps the new rows out of
+            # a bulk delete or restore that is summing the user's files
+            FileService._adjust_usage(user, sum(f.file_size for f, _ in pending))
+            File.objects.bulk_create([file_instance for file_instance, _ in pending])
+            FileChunk.objects.bulk_create(manifests)
+            StagedUpload.objects.filter(pk__in=staged_ids).delete()
+            bump_list_version(user.pk)
+
+        return [
+            {
                 'id':str(file_instance.id),
                 'name':file_instance.original_name,
                 "size": file_instance.file_size,
@@ -90,31 +134,202 @@ class FileService:
                 "checksum": file_instance.checksum,
                 "created_at": file_instance.created_at,
                 "is_duplicate": is_duplicate,
-            })
-        return uploaded_files
+            }
+            for file_instance, is_duplicate in pending
+        ]
+
+    @staticmethod
+    def _stage_blob(file_instance, file_obj):
+        """
+        write the bytes to their final storage name, recorded as staged
+        until the metadata transaction commits
+        """
+        field=File._meta.get_field('file')
+        name=field.storage.get_available_name(
+            field.generate_filename(file_instance, file_obj.name),
+            max_length=field.max_length
+        )
+        staged=StagedUpload.objects.create(blob=name)
+        saved=field.storage.save(name, file_obj, max_length=field.max_length)
+        if saved!=name:
+            StagedUpload.objects.filter(pk=staged.pk).update(blob=saved)
+        file_instance.file=saved
+        return staged
 
     @staticmethod
     def download_file(user, file_id):
-        file_obj=get_object_or_404(File, id=file_id, user=user)
+        file_obj=get_object_or_404(
+            File.objects.using(read_db()), id=file_id, user=user
+        )
+        FileService.mark_accessed(file_obj)
 
         return FileResponse(
-            file_obj.file.open('rb'),
+            FileService.open_file(file_obj),
             as_attachment=True,
             filename=file_obj.original_name
         )
 
     @staticmethod
     def user_list_files(user):
-        all_files=File.objects.filter(user=user, is_deleted=False)
+        all_files=File.objects.using(read_db()).filter(user=user, is_deleted=False)
         return all_files
 
     @staticmethod
-    def user_delete_file(user, file_id):
-        file_obj=get_object_or_404(
-            File, user=user, id=file_id, is_deleted=False
+    def iter_user_files(user, fields, batch_size=2000):
+        """
+        rows of the user's files as dicts, fetched in keyset batches so
+        memory stays flat however many files the user has. The database is
+        picked on the call, a streamed response iterates after the request's
+        pin is gone
+        """
+        files=FileService.user_list_files(user).order_by('id').values(*fields)
+        return FileService._iter_batches(files, batch_size)
+
+    @staticmethod
+    def _iter_batches(files, batch_size):
+        last_id=None
+        while True:
+            batch=files if last_id is None else files.filter(id__gt=last_id)
+            rows=list(batch[:batch_size])
+            yield from rows
+            if len(rows)<batch_size:
+                return
+            last_id=rows[-1]['id']
+
+    @staticmethod
+    def changes_since(user, fields, after=None, limit=500):
+        """
+        files created, updated or deleted after the (updated_at, id) position,
+        oldest first. Deleted files are reported as tombstones.
+        Reads the primary, a lagging replica could let the cursor skip rows
+        """
+        horizon=timezone.now()-timedelta(seconds=settings.FILE_SYNC_SETTLE_SECONDS)
+        changes=File.objects.using(DEFAULT_DB_ALIAS).filter(user=user, updated_at__lte=horizon)
+        if after is not None:
+            updated_at, file_id=after
+            changes=changes.filter(
+                models.Q(updated_at__gt=updated_at)|models.Q(updated_at=updated_at, id__gt=file_id)
+            )
+        rows=list(
+            changes.order_by('updated_at', 'id')
+            .values(*fields, 'updated_at', 'is_deleted')[:limit+1]
         )
-        file_obj.is_deleted=True
-        file_obj.save()
+        has_more=len(rows)>limit
+        rows=rows[:limit]
+
+        results=[]
+        for row in rows:
+            if row.pop('is_deleted'):
+                results.append({'id':row['id'], 'deleted':True, 'updated_at':row['updated_at']})
+            else:
+                results.append({**row, 'deleted':False})
+        cursor=encode_cursor(rows[-1]['updated_at'], rows[-1]['id']) if rows else None
+        return {'changes':results, 'cursor':cursor, 'has_more':has_more}
+
+    @staticmethod
+    def user_delete_file(user, file_id):
+        with transaction.atomic():
+            FileService._locked_usage(user)
+            file_obj=get_object_or_404(
+                File, user=user, id=file_id, is_deleted=False
+            )
+            file_obj.is_deleted=True
+            file_obj.save(update_fields=['is_deleted', 'updated_at'])
+            FileService._adjust_usage(user, -file_obj.file_size)
+            bump_list_version(user.pk)
+
+    @staticmethod
+    def bulk_set_deleted(user, deleted, ids=None, filters=None):
+        """
+        soft delete or restore the user's files picked by ids or filters
+        with one UPDATE, the quota counter changes in the same transaction
+        """
+        with transaction.atomic():
+            used=FileService._locked_usage(user)
+            files=File.objects.filter(user=user, is_deleted=not deleted)
+            if ids is not None:
+                files=files.filter(id__in=ids)
+            if filters:
+                files=FileService._apply_bulk_filters(files, filters)
+            size=files.aggregate(total=models.Sum('file_size'))['total'] or 0
+            if not deleted and used+size>settings.USER_STORAGE_QUOTA:
+                raise QuotaExceeded(
+                    f"Insufficient storage space. Restoring needs {size}, only {settings.USER_STORAGE_QUOTA-used} left"
+                )
+            count=files.update(is_deleted=deleted, updated_at=timezone.now())
+            FileService._adjust_usage(user, -size if deleted else size)
+            if count:
+                bump_list_version(user.pk)
+        return {'count':count, 'size':size}
+
+    @staticmethod
+    def _apply_bulk_filters(files, filters):
+        if filters.get('content_type'):
+            files=files.filter(content_type__startswith=filters['content_type'])
+        if filters.get('created_after'):
+            files=files.filter(created_at__gte=filters['created_after'])
+        if filters.get('created_before'):
+            files=files.filter(created_at__lt=filters['created_before'])
+        return files
+
+    @staticmethod
+    def _locked_usage(user):
+        """
+        lock the user's row, serializing quota changes, and return the usage
+        """
+        return User.objects.select_for_update().filter(pk=user.pk).values_list(
+            'storage_used', flat=True
+        ).get()
+
+    @staticmethod
+    def _adjust_usage(user, delta):
+        if delta:
+            User.objects.filter(pk=user.pk).update(storage_used=models.F('storage_used')+delta)
+
+    @staticmethod
+    def storage_usage(user):
+        # deleted files don't count, restoring them is checked against the quota
+        return User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user.pk).values_list(
+            'storage_used', flat=True
+        ).get()
+
+    @staticmethod
+    def remaining_storage(user):
+        return settings.USER_STORAGE_QUOTA-FileService.storage_usage(user)
+
+    @staticmethod
+    def open_file(file_obj):
+        """
+        small files are served from the hot file cache, keyed by checksum
+        so deduplicated copies share an entry
+        """
+        if file_obj.checksum and hot_file_cache.accepts(file_obj.file_size):
+            data=hot_file_cache.get(file_obj.checksum)
+            if data is None:
+                with FileService._open_stored(file_obj) as stored:
+                    data=stored.read()
+                hot_file_cache.put(file_obj.checksum, data)
+            return io.BytesIO(data)
+        return FileService._open_stored(file_obj)
+
+    @staticmethod
+    def _open_stored(file_obj):
+        if file_obj.is_chunked:
+            return ChunkDedupService.open(file_obj)
+        return file_obj.file.open('rb')
+
+    @staticmethod
+    def mark_accessed(file_obj):
+        """
+        stamp every row sharing the stored blob, the tiering policy works per blob.
+        bookkeeping writes name the primary explicitly so they don't pin the reader to it
+        """
+        rows=File.objects.using(DEFAULT_DB_ALIAS)
+        if file_obj.is_chunked:
+            rows=rows.filter(pk=file_obj.pk)
+        else:
+            rows=rows.filter(file=file_obj.file.name)
+        rows.update(last_accessed_at=timezone.now())
 
     @staticmethod
     def _calculate_checksum(file_obj):
@@ -125,8 +340,115 @@ class FileService:
         file_obj.seek(0)
         return hash_md5.hexdigest()
         
-            
-    
+
+
+
+class ChunkDedupService:
+    """
+    Optional storage mode that splits large files into content-defined
+    chunks, stores each distinct chunk once and rebuilds files on read.
+    """
+    @staticmethod
+    def should_chunk(file_obj):
+        return (
+            settings.FILE_CHUNK_DEDUP
+            and file_obj.size>=settings.FILE_CHUNK_DEDUP_MIN_FILE_SIZE
+        )
+
+    @staticmethod
+    def store(file_instance, file_obj):
+        """
+        write the file's new chunks and return its unsaved manifest
+        """
+        file_obj.seek(0)
+        manifest=[]
+        offset=0
+        for position, data in enumerate(iter_chunks(
+            file_obj,
+            min_size=settings.FILE_CHUNK_MIN_SIZE,
+            avg_size=settings.FILE_CHUNK_AVG_SIZE,
+            max_size=settings.FILE_CHUNK_MAX_SIZE
+        )):
+            chunk=ChunkDedupService._store_chunk(data)
+            manifest.append(FileChunk(
+                file=file_instance,
+                chunk=chunk,
+                position=position,
+                offset=offset
+            ))
+            offset+=len(data)
+        file_obj.seek(0)
+        return manifest
+
+    @staticmethod
+    def _store_chunk(data):
+        digest=hashlib.sha256(data).hexdigest()
+        chunk=Chunk.objects.filter(digest=digest).first()
+        if chunk:
+            return chunk
+        name=default_storage.generate_filename(f"chunks/{digest}")
+        written=None
+        if not default_storage.exists(name):
+            name=written=default_storage.save(name, ContentFile(data))
+        chunk, created=Chunk.objects.get_or_create(
+            digest=digest,
+            defaults={'size':len(data), 'blob':name}
+        )
+        if not created and written and written!=chunk.blob:
+            # another upload stored the same chunk first, nothing references this copy
+            default_storage.delete(written)
+        return chunk
+
+    @staticmethod
+    def copy_manifest(source, target, pending_manifest=()):
+        if source._state.adding:
+            # source is part of the same upload batch and not saved yet
+            source_chunks=[row for row in pending_manifest if row.file is source]
+        else:
+            source_chunks=source.chunks.all()
+        return [
+            FileChunk(
+                file=target,
+                chunk_id=file_chunk.chunk_id,
+                position=file_chunk.position,
+                offset=file_chunk.offset
+            )
+            for file_chunk in source_chunks
+        ]
+
+    @staticmethod
+    def open(file_obj):
+        chunks=list(
+            FileChunk.objects.using(file_obj._state.db)
+            .filter(file=file_obj)
+            .order_by('position')
+            .values_list('offset', 'chunk__size', 'chunk__blob')
+        )
+        raw=ChunkedFileReader(chunks, lambda blob: default_storage.open(blob, 'rb'))
+        return io.BufferedReader(raw, buffer_size=settings.FILE_CHUNK_AVG_SIZE)
+
+    @staticmethod
+    def dedup_stats(user):
+        """
+        logical bytes of the user's chunked files against the bytes of the
+        distinct chunks they reference
+        """
+        # one alias for both, the subquery can't cross databases
+        db=read_db()
+        user_files=File.objects.using(db).filter(
+            user=user, is_chunked=True, is_deleted=False
+        )
+        logical_size=user_files.aggregate(total=models.Sum('file_size'))['total'] or 0
+        stored_size=Chunk.objects.using(db).filter(
+            digest__in=FileChunk.objects.filter(file__in=user_files).values('chunk')
+        ).aggregate(total=models.Sum('size'))['total'] or 0
+        return {
+            'logical_size':logical_size,
+            'stored_size':stored_size,
+            'dedup_ratio':round(logical_size/stored_size, 2) if stored_size else None
+        }
+
+
 class FileShareService:
     """
     service handles the file sharing business logic
@@ -159,6 +481,45 @@ class FileShareService:
             print("Error")
         return share
     
+    @staticmethod
+    def owner_shares(owner, status=None, accessed=None, file_id=None):
+        """
+        shares created by the owner, newest first, with file and owner joined in
+        """
+        shares=FileShareLink.objects.using(read_db()).filter(owner=owner).select_related(
+            'file', 'owner'
+        ).order_by('-created_at')
+        now=timezone.now()
+        if status=='active':
+            shares=shares.filter(is_active=True, expiration_datetime__gt=now)
+        elif status=='expired':
+            shares=shares.filter(expiration_datetime__lte=now)
+        elif status=='revoked':
+            shares=shares.filter(is_active=False)
+        if accessed is not None:
+            shares=shares.filter(accessed=accessed)
+        if file_id:
+            shares=shares.filter(file_id=file_id)
+        return shares
+
+    @staticmethod
+    def bulk_revoke(owner, share_ids):
+        """
+        deactivates the owner's shares in a single UPDATE, ids of other
+        owners' shares are ignored
+        """
+        owned_ids=list(
+            FileShareLink.objects.filter(owner=owner, id__in=share_ids, is_active=True)
+            .values_list('id', flat=True)
+        )
+        if not owned_ids:
+            return 0
+        revoked=FileShareLink.objects.filter(
+            id__in=owned_ids, is_active=True
+        ).update(is_active=False)
+        signing.revoke_shares(owned_ids)
+        return revoked
+
     @staticmethod
     def send_share_email(share, message):
         """
@@ -206,14 +567,33 @@ class FileShareService:
 class ViewFileShareService:
     @staticmethod
     def get_file_response(share):
-        return share.file.file.open("rb"), share.file.original_name
+        FileService.mark_accessed(share.file)
+        return FileService.open_file(share.file), share.file.original_name
 
     
+    @staticmethod
+    def get_signed_download_token(share):
+        return signing.sign_download(share)
+
+    @staticmethod
+    def verify_signed_download(token):
+        return signing.verify_download(token)
+
+    @staticmethod
+    def open_signed_download(payload):
+        """
+        open the file a verified token points at, without touching the database
+        (chunked files still need their manifest)
+        """
+        if payload['c']:
+            return ChunkDedupService.open(File(id=payload['f'], is_chunked=True))
+        return default_storage.open(payload['n'], 'rb')
+
     @staticmethod
     def mark_as_accessed(share):
         if not share.accessed:
             share.accessed=True
             share.accessed_at=timezone.now()
-            share.save(update_fields=["accessed", "accessed_at"])
+            share.save(using=DEFAULT_DB_ALIAS, update_fields=["accessed", "accessed_at"])
 
 
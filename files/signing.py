@@ -0,0 +1,91 @@
+"""
+Short-lived HMAC signed download URLs for share links.
+A token carries everything needed to serve the file, so the app (or an
+edge proxy holding the same key) can verify it without a database query.
+FileShareLink stays the source of truth: tokens are only issued after the
+share itself has been validated.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+SIGNED_URL_SALT='files.signed-download'
+REVOCATION_CACHE_PREFIX='files:share-revoked'
+
+
+class SignedURLError(Exception):
+    """
+    Raised when a signed download token is invalid, expired or revoked
+    """
+    pass
+
+
+def _signer():
+    return signing.Signer(
+        key=settings.SHARE_URL_SIGNING_KEY or settings.SECRET_KEY,
+        salt=SIGNED_URL_SALT
+    )
+
+
+def _window_expiry(now):
+    """
+    end of the TTL window after the current one, so all URLs signed for a
+    share within one window are identical and cacheable by a proxy. A URL
+    lives between one and two TTLs
+    """
+    ttl=settings.SHARE_SIGNED_URL_TTL
+    return math.ceil((now+ttl)/ttl)*ttl
+
+
+def sign_download(share, scope='share'):
+    file=share.file
+    expires_at=min(
+        _window_expiry(int(time.time())),
+        int(share.expiration_datetime.timestamp())
+    )
+    return _signer().sign_object({
+        'f':str(file.id),
+        's':str(share.id),
+        'n':file.file.name,
+        'o':file.original_name,
+        'c':int(file.is_chunked),
+        'e':expires_at,
+        'sc':scope,
+    })
+
+
+def verify_download(token, scope='share'):
+    try:
+        payload=_signer().unsign_object(token)
+    except signing.BadSignature:
+        raise SignedURLError("Invalid download link")
+    if payload.get('sc')!=scope:
+        raise SignedURLError("Invalid download link")
+    if payload['e']<time.time():
+        raise SignedURLError("Download link have expired")
+    if is_revoked(payload['s']):
+        raise SignedURLError("Download link have been revoked")
+    return payload
+
+
+def _revocation_key(share_id):
+    return f'{REVOCATION_CACHE_PREFIX}:{share_id}'
+
+
+def revoke_shares(share_ids):
+    """
+    One key per share, kept for the longest lifetime of a signed URL, by
+    then every URL signed for the share has expired on its own.
+    The default cache must be shared by all workers (see files.E001).
+    """
+    cache.set_many(
+        {_revocation_key(share_id):1 for share_id in share_ids},
+        timeout=2*settings.SHARE_SIGNED_URL_TTL
+    )
+
+
+def is_revoked(share_id):
+    return cache.get(_revocation_key(share_id)) is not None
@@ -0,0 +1,252 @@
+import hashlib
+import io
+import os
+import posixpath
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.functional import cached_property
+
+HEX_KEY_RE = re.compile(r'^[0-9a-f]+$')
+
+
+class ShardedFileSystemStorage(FileSystemStorage):
+    """
+    Filesystem storage that fans stored files out into hash-prefixed
+    directories, e.g. userfiles/ab/cd/abcd1234...jpg, so no single
+    directory grows with the number of files or users.
+    """
+    def __init__(self, shard_depth=2, shard_width=2, **kwargs):
+        super().__init__(**kwargs)
+        self.shard_depth=shard_depth
+        self.shard_width=shard_width
+
+    def _shard_key(self, basename):
+        key, ext=os.path.splitext(basename)
+        key=key.lower()
+        if HEX_KEY_RE.match(key) and len(key)>=self.shard_depth*self.shard_width:
+            return key, basename
+        # non hex names are hashed so the shards stay evenly distributed
+        key=hashlib.md5(basename.encode()).hexdigest()
+        return key, f"{key}{ext}"
+
+    def shard_name(self, name):
+        """
+        map <prefix>/<key><ext> to <prefix>/<k0>/<k1>/<key><ext>
+        """
+        dirname, basename=posixpath.split(name)
+        key, basename=self._shard_key(basename)
+        shards=[
+            key[i*self.shard_width:(i+1)*self.shard_width]
+            for i in range(self.shard_depth)
+        ]
+        return posixpath.join(dirname, *shards, basename)
+
+    def is_sharded(self, name):
+        parts=name.split('/')
+        if len(parts)<=self.shard_depth:
+            return False
+        key=os.path.splitext(parts[-1])[0].lower()
+        shards=parts[-1-self.shard_depth:-1]
+        return ''.join(shards)==key[:self.shard_depth*self.shard_width]
+
+    def generate_filename(self, filename):
+        filename=super().generate_filename(filename).replace('\\', '/')
+        if self.is_sharded(filename):
+            return filename
+        return self.shard_name(filename)
+
+
+class RangedObjectReader(io.RawIOBase):
+    """
+    Seekable raw reader over an object, each read is a ranged GET
+    """
+    def __init__(self, client, bucket, key, size):
+        self.client=client
+        self.bucket=bucket
+        self.key=key
+        self.size=size
+        self._pos=0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence==io.SEEK_SET:
+            pos=offset
+        elif whence==io.SEEK_CUR:
+            pos=self._pos+offset
+        elif whence==io.SEEK_END:
+            pos=self.size+offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if pos<0:
+            raise ValueError("Negative seek position")
+        self._pos=pos
+        return pos
+
+    def readinto(self, buffer):
+        if self._pos>=self.size or not len(buffer):
+            return 0
+        end=min(self._pos+len(buffer), self.size)-1
+        body=self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={self._pos}-{end}"
+        )['Body'].read()
+        buffer[:len(body)]=body
+        self._pos+=len(body)
+        return len(body)
+
+
+class ObjectStorage(Storage):
+    """
+    S3 compatible object storage. Works against AWS S3 or any compatible
+    server (MinIO, a moto server) through endpoint_url.
+    Uploads are streamed with multipart, reads are streamed with ranged GETs.
+    """
+    def __init__(self, bucket, endpoint_url=None, access_key=None, secret_key=None,
+                 region_name=None, multipart_chunk_size=8*1024*1024,
+                 read_chunk_size=1024*1024):
+        self.bucket=bucket
+        self.endpoint_url=endpoint_url
+        self.access_key=access_key
+        self.secret_key=secret_key
+        self.region_name=region_name
+        self.multipart_chunk_size=multipart_chunk_size
+        self.read_chunk_size=read_chunk_size
+
+    @cached_property
+    def client(self):
+        try:
+            import boto3
+        except ImportError:
+            raise ImproperlyConfigured("ObjectStorage requires the boto3 package")
+        return boto3.client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            aws_access_key_id=self.access_key,
+            aws_secret_access_key=self.secret_key,
+            region_name=self.region_name
+        )
+
+    @cached_property
+    def transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(
+            multipart_threshold=self.multipart_chunk_size,
+            multipart_chunksize=self.multipart_chunk_size
+        )
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise ValueError("ObjectStorage files are read only")
+        size=self.size(name)
+        raw=RangedObjectReader(self.client, self.bucket, name, size)
+        reader=io.BufferedReader(raw, buffer_size=self.read_chunk_size)
+        file=File(reader, name=name)
+        file.size=size
+        return file
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        self.client.upload_fileobj(
+            content,
+            self.bucket,
+            name,
+            Config=self.transfer_config
+        )
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=name)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=name)['ContentLength']
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket':self.bucket, 'Key':name}
+        )
+
+
+class TieredStorage(Storage):
+    """
+    Hot tier on a filesystem with an optional cold object tier.
+    New files are written to the hot tier, reads fall back to the cold tier.
+    With several web servers the hot tier has to be a shared volume
+    (FILE_STORAGE_HOT_ROOT).
+    Files are moved between tiers by the tier_files command.
+    """
+    def __init__(self, hot=None, cold=None):
+        self.hot=ShardedFileSystemStorage(**(hot or {}))
+        self.cold=ObjectStorage(**cold) if cold else None
+
+    def _tier_for(self, name):
+        if self.cold is None or self.hot.exists(name):
+            return self.hot
+        return self.cold
+
+    def _open(self, name, mode='rb'):
+        return self._tier_for(name).open(name, mode)
+
+    def _save(self, name, content):
+        return self.hot._save(name, content)
+
+    def generate_filename(self, filename):
+        return self.hot.generate_filename(filename)
+
+    def get_available_name(self, name, max_length=None):
+        return self.hot.get_available_name(name, max_length=max_length)
+
+    def exists(self, name):
+        return self.hot.exists(name) or (self.cold is not None and self.cold.exists(name))
+
+    def delete(self, name):
+        self.hot.delete(name)
+        if self.cold is not None:
+            self.cold.delete(name)
+
+    def size(self, name):
+        return self._tier_for(name).size(name)
+
+    def path(self, name):
+        return self.hot.path(name)
+
+    def url(self, name):
+        return self._tier_for(name).url(name)
+
+    def move_to_cold(self, name):
+        if self.cold is None:
+            raise ImproperlyConfigured("No cold storage tier is configured")
+        # a rerun after an interrupted move finds the blob already gone
+        if self.hot.exists(name):
+            with self.hot.open(name, 'rb') as content:
+                self.cold._save(name, content)
+            self.hot.delete(name)
+
+    def move_to_hot(self, name):
+        if not self.hot.exists(name):
+            with self.cold.open(name, 'rb') as content:
+                self.hot._save(name, content)
+        self.cold.delete(name)
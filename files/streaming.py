@@ -0,0 +1,50 @@
+"""
+Streaming JSON encoding for large listings. Rows are plain dicts from
+QuerySet.values(), encoded with orjson when it is installed.
+Output matches what the DRF serializers render for the same fields.
+"""
+import datetime
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        value=value.isoformat()
+        if value.endswith('+00:00'):
+            value=value[:-6]+'Z'
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value, default=_json_default, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=_json_default, separators=(',', ':')).encode()
+
+
+def stream_json_array(rows, batch_size=500):
+    """
+    yield a JSON array piece by piece, a batch of rows per chunk
+    """
+    yield b'['
+    first=True
+    batch=[]
+    for row in rows:
+        batch.append(dumps(row))
+        if len(batch)>=batch_size:
+            yield (b'' if first else b',')+b','.join(batch)
+            first=False
+            batch=[]
+    if batch:
+        yield (b'' if first else b',')+b','.join(batch)
+    yield b']'
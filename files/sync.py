@@ -0,0 +1,25 @@
+"""
+Opaque cursors for the incremental sync API.
+A cursor is the (updated_at, id) of the last change a client has seen,
+signed so clients cannot forge or edit it.
+"""
+from django.core import signing
+from django.utils.dateparse import parse_datetime
+
+SYNC_CURSOR_SALT='files.sync-cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(updated_at, file_id):
+    return signing.dumps([updated_at.isoformat(), str(file_id)], salt=SYNC_CURSOR_SALT)
+
+
+def decode_cursor(cursor):
+    try:
+        updated_at, file_id=signing.loads(cursor, salt=SYNC_CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        raise InvalidCursor("Invalid sync cursor")
+    return parse_datetime(updated_at), file_id
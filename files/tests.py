@@ -1,3 +1,920 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from django.utils import timezone
+
+from files import chunking, routers, signing, throttling
+from files.middleware import PrimaryPinningMiddleware
+from files.models import Chunk, File, FileChunk, FileShareLink, StagedUpload, User
+from files.serializers import PublicFileSerializer
+from files.services import ChunkDedupService, FileService, QuotaExceeded
+from files.storage import ObjectStorage
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws=None
+
+
+class MediaRootMixin:
+    """
+    stores blobs in a temporary media root for the duration of each test
+    """
+    def setUp(self):
+        super().setUp()
+        self.media_root=tempfile.mkdtemp()
+        override=override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        self.storage=File._meta.get_field('file').storage
+
+
+class ChunkingTests(SimpleTestCase):
+    def _chunks(self, data):
+        return list(chunking.iter_chunks(io.BytesIO(data), 2048, 8192, 65536))
+
+    def test_chunks_reassemble_the_stream(self):
+        data=random.Random(7).randbytes(512*1024)
+        chunks=self._chunks(data)
+        self.assertEqual(b''.join(chunks), data)
+        self.assertTrue(all(len(chunk)<=65536 for chunk in chunks))
+
+    def test_fallback_finds_the_native_cut_points(self):
+        if chunking.fastcdc_cy is None:
+            self.skipTest("fastcdc is not installed")
+        data=random.Random(7).randbytes(512*1024)
+        native=[len(chunk) for chunk in self._chunks(data)]
+        with mock.patch.object(chunking, 'fastcdc_cy', None):
+            fallback=[len(chunk) for chunk in self._chunks(data)]
+        self.assertEqual(fallback, native)
+
+    def test_edit_near_the_start_keeps_later_chunks(self):
+        data=random.Random(7).randbytes(512*1024)
+        original=set(self._chunks(data))
+        edited=self._chunks(b'edit'+data[100:])
+        shared=[chunk for chunk in edited if chunk in original]
+        self.assertGreaterEqual(len(shared), len(edited)-2)
+
+
+class ChunkStoreTests(MediaRootMixin, TestCase):
+    def test_losing_a_race_to_store_a_chunk_removes_the_extra_blob(self):
+        data=b'shared chunk'
+        digest=hashlib.sha256(data).hexdigest()
+        save=self.storage.save
+        names={}
+
+        def racing_save(name, content, **kwargs):
+            # another upload stores the same chunk after our exists() check
+            names['winner']=save(name, ContentFile(data))
+            Chunk.objects.create(digest=digest, size=len(data), blob=names['winner'])
+            names['loser']=save(name, content, **kwargs)
+            return names['loser']
+
+        with mock.patch.object(self.storage, 'save', racing_save):
+            chunk=ChunkDedupService._store_chunk(data)
+
+        self.assertEqual(chunk.blob, names['winner'])
+        self.assertNotEqual(names['loser'], names['winner'])
+        self.assertTrue(self.storage.exists(names['winner']))
+        self.assertFalse(self.storage.exists(names['loser']))
+
+
+class SweepStagedUploadsTests(MediaRootMixin, TestCase):
+    def _chunk(self, data):
+        name=self.storage.save(f"chunks/{len(data):064x}", ContentFile(data))
+        chunk=Chunk.objects.create(digest=f"{len(data):064x}", size=len(data), blob=name)
+        Chunk.objects.filter(pk=chunk.pk).update(created_at=timezone.now()-timedelta(days=1))
+        return chunk
+
+    def test_removes_chunks_of_uploads_that_never_committed(self):
+        user=User.objects.create(email='sweep@example.com')
+        file=File.objects.create(
+            user=user, original_name='a.bin', file_size=3, content_type='application/octet-stream', is_chunked=True
+        )
+        referenced=self._chunk(b'abc')
+        FileChunk.objects.create(file=file, chunk=referenced, position=0, offset=0)
+        orphan=self._chunk(b'orphan')
+
+        call_command('sweep_staged_uploads', stdout=io.StringIO())
+
+        self.assertFalse(Chunk.objects.filter(pk=orphan.pk).exists())
+        self.assertFalse(self.storage.exists(orphan.blob))
+        self.assertTrue(Chunk.objects.filter(pk=referenced.pk).exists())
+        self.assertTrue(self.storage.exists(referenced.blob))
+
+    def test_keeps_recent_chunks(self):
+        chunk=self._chunk(b'in flight')
+        Chunk.objects.filter(pk=chunk.pk).update(created_at=timezone.now())
+
+        call_command('sweep_staged_uploads', stdout=io.StringIO())
+
+        self.assertTrue(Chunk.objects.filter(pk=chunk.pk).exists())
+
+
+class ScrubFilesTests(MediaRootMixin, TestCase):
+    def test_resumed_scrub_counts_chunks_verified_before_the_stop(self):
+        user=User.objects.create(email='scrub@example.com')
+        file=File.objects.create(
+            user=user, original_name='a.bin', file_size=6, content_type='application/octet-stream', is_chunked=True
+        )
+        chunks=[]
+        for position, data in enumerate([b'abc', b'def']):
+            digest=hashlib.sha256(data).hexdigest()
+            name=self.storage.save(f"chunks/{digest}", ContentFile(data))
+            chunks.append(Chunk.objects.create(digest=digest, size=len(data), blob=name))
+            FileChunk.objects.create(file=file, chunk=chunks[-1], position=position, offset=position*3)
+        chunks.sort(key=lambda chunk: chunk.digest)
+
+        # the first run verified one chunk and stopped
+        started=timezone.now()-timedelta(hours=1)
+        Chunk.objects.filter(pk=chunks[0].pk).update(last_verified_at=started+timedelta(minutes=1))
+        checkpoint=os.path.join(self.media_root, 'checkpoint')
+        with open(checkpoint, 'w') as handle:
+            json.dump({'phase':'chunks', 'last':chunks[0].digest, 'started':started.isoformat()}, handle)
+
+        call_command('scrub_files', checkpoint=checkpoint, rate_limit=0, stdout=io.StringIO())
+
+        file.refresh_from_db()
+        self.assertIsNotNone(file.last_verified_at)
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_unreadable_blob_is_reported_and_the_scrub_goes_on(self):
+        user=User.objects.create(email='scrub-errors@example.com')
+        good=self.storage.save('userfiles/good.txt', ContentFile(b'good'))
+        File.objects.create(
+            user=user, file=good, original_name='good.txt', file_size=4, content_type='text/plain',
+            checksum=hashlib.md5(b'good').hexdigest()
+        )
+        # a directory where the blob should be, open() fails with EISDIR
+        os.makedirs(getattr(self.storage, 'hot', self.storage).path('userfiles/broken.txt'))
+        File.objects.create(
+            user=user, file='userfiles/broken.txt', original_name='broken.txt', file_size=4,
+            content_type='text/plain', checksum='0'*32
+        )
+        stdout, stderr=io.StringIO(), io.StringIO()
+
+        call_command(
+            'scrub_files', checkpoint=os.path.join(self.media_root, 'checkpoint'), rate_limit=0,
+            stdout=stdout, stderr=stderr
+        )
+
+        self.assertIn("1 verified, 0 mismatched, 0 missing, 1 unreadable", stdout.getvalue())
+        self.assertIn("UNREADABLE userfiles/broken.txt", stderr.getvalue())
+        self.assertIsNotNone(File.objects.get(file=good).last_verified_at)
+
+
+REPLICA=settings.DATABASE_REPLICAS[0] if settings.DATABASE_REPLICAS else None
+
+
+@skipUnless(REPLICA, "no replica alias configured (config.test_settings has one)")
+class ReplicaRoutingTests(MediaRootMixin, TestCase):
+    """
+    The replica alias mirrors the primary, queries are told apart by the
+    connection that ran them. The replica connection doesn't see rows the
+    test's open transaction wrote on the primary.
+    """
+    databases={DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS[:1]}
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user=User.objects.create(email='replica@example.com')
+        # the create above pinned the test to the primary
+        self.addCleanup(routers.restore_pin, routers.reset_pin())
+
+    def _queries(self, func):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            func()
+        return len(primary), len(replica)
+
+    def test_reads_go_to_the_replica_until_a_write(self):
+        read=lambda: list(FileService.iter_user_files(self.user, ['id']))
+        self.assertEqual(routers.read_db(), REPLICA)
+        self.assertEqual(self._queries(read), (0, 1))
+
+        File.objects.create(user=self.user, original_name='a.txt', file_size=1, content_type='text/plain')
+
+        self.assertTrue(routers.is_pinned())
+        self.assertEqual(routers.read_db(), DEFAULT_DB_ALIAS)
+        self.assertEqual(self._queries(read), (1, 0))
+
+    def test_pin_expires_after_the_lag_tolerance(self):
+        with override_settings(DATABASE_REPLICA_LAG_TOLERANCE=5):
+            routers.pin_primary()
+            self.assertEqual(routers.read_db(), DEFAULT_DB_ALIAS)
+            with mock.patch.object(routers.time, 'time', return_value=time.time()+6):
+                self.assertEqual(routers.read_db(), REPLICA)
+
+    def test_pin_is_carried_to_the_next_request_in_a_cookie(self):
+        reads=[]
+
+        def view(request):
+            if request.method=='POST':
+                User.objects.filter(pk=self.user.pk).update(last_login=timezone.now())
+            reads.append(routers.read_db())
+            return HttpResponse()
+
+        middleware=PrimaryPinningMiddleware(view)
+        factory=RequestFactory()
+
+        response=middleware(factory.post('/'))
+        cookie=response.cookies[PrimaryPinningMiddleware.cookie_name]
+        self.assertGreater(float(cookie.value), time.time())
+        self.assertEqual(cookie['max-age'], routers.lag_tolerance())
+        # the pin ends with the request that set it
+        self.assertFalse(routers.is_pinned())
+
+        follow_up=factory.get('/')
+        follow_up.COOKIES[PrimaryPinningMiddleware.cookie_name]=cookie.value
+        response=middleware(follow_up)
+        self.assertNotIn(PrimaryPinningMiddleware.cookie_name, response.cookies)
+
+        middleware(factory.get('/'))
+
+        self.assertEqual(reads, [DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS, REPLICA])
+
+    def test_pin_of_a_cookieless_client_is_kept_per_user(self):
+        other=User.objects.create(email='other@example.com')
+        routers.reset_pin()
+        reads=[]
+
+        def view(request):
+            # DRF sets the authenticated user on the Django request
+            request.user=self.user if request.path=='/mine/' else other
+            if request.method=='POST':
+                User.objects.filter(pk=self.user.pk).update(last_login=timezone.now())
+            reads.append(routers.read_db())
+            return HttpResponse()
+
+        middleware=PrimaryPinningMiddleware(view)
+        factory=RequestFactory()
+
+        middleware(factory.post('/mine/'))
+        middleware(factory.get('/mine/'))
+        middleware(factory.get('/theirs/'))
+
+        self.assertEqual(reads, [DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS, REPLICA])
+
+    def test_new_share_link_is_found_before_the_replica_has_it(self):
+        file=File.objects.create(user=self.user, original_name='a.txt', file_size=1, content_type='text/plain')
+        share=FileShareLink.objects.create(
+            file=file,
+            owner=self.user,
+            recipient_email='friend@example.com',
+            share_token='new-share',
+            expiration_datetime=timezone.now()+timedelta(days=1)
+        )
+        # the recipient's request has no pin
+        routers.reset_pin()
+
+        serializer=PublicFileSerializer(data={'token':share.share_token})
+
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.share, share)
+
+    def test_list_after_an_upload_reads_the_primary(self):
+        client=APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+        response=client.post(
+            reverse('files:file-upload'),
+            {'files':[SimpleUploadedFile('a.txt', b'hello')]},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        # token clients don't send cookies
+        client.cookies.clear()
+
+        response=client.get(reverse('files:file-list'))
+        body=json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['original_name'] for row in body], ['a.txt'])
+
+
+@override_settings(FILE_CHUNK_DEDUP=False)
+class UploadLockWaitTests(MediaRootMixin, TransactionTestCase):
+    """
+    Parallel uploads against a probe that updates the uploading user's row,
+    the row every upload transaction locks. Storage writes are slowed down
+    to stand in for large files. They must run outside any transaction so
+    the probe never waits for them.
+    """
+    WRITE_SECONDS=0.5
+
+    def setUp(self):
+        if connection.vendor=='sqlite' and connection.is_in_memory_db():
+            self.skipTest("threads can't wait on locks of an in-memory SQLite database")
+        super().setUp()
+        self.user=User.objects.create(email='locks@example.com')
+        self.writes_in_transaction=[]
+
+    def _slow_save(self, name, content):
+        self.writes_in_transaction.append(connection.in_atomic_block)
+        time.sleep(self.WRITE_SECONDS)
+        return name
+
+    def test_lock_wait_stays_below_write_time(self):
+        waits=[]
+        done=threading.Event()
+
+        def probe():
+            try:
+                while not done.is_set():
+                    started=time.perf_counter()
+                    with transaction.atomic():
+                        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now())
+                    waits.append(time.perf_counter()-started)
+                    time.sleep(0.01)
+            finally:
+                connection.close()
+
+        def upload(batch):
+            try:
+                FileService.upload_files(self.user, [
+                    SimpleUploadedFile(f"{batch}-{i}.bin", random.randbytes(1024))
+                    for i in range(2)
+                ])
+            finally:
+                connection.close()
+
+        with mock.patch.object(self.storage, '_save', self._slow_save):
+            prober=threading.Thread(target=probe)
+            prober.start()
+            uploaders=[threading.Thread(target=upload, args=(batch,)) for batch in range(4)]
+            for thread in uploaders:
+                thread.start()
+            for thread in uploaders:
+                thread.join()
+            done.set()
+            prober.join()
+
+        self.assertEqual(File.objects.filter(user=self.user).count(), 8)
+        self.assertFalse(StagedUpload.objects.exists())
+        self.assertFalse(any(self.writes_in_transaction))
+        self.assertLess(
+            max(waits), self.WRITE_SECONDS/2,
+            f"probe lock wait max {max(waits)*1000:.0f}ms over {len(waits)} probes"
+        )
+
+
+@skipIf(mock_aws is None, "moto is not installed (requirements-dev.txt)")
+class ObjectStorageTests(MediaRootMixin, TestCase):
+    """
+    the object tier against moto's in-process S3
+    """
+    def setUp(self):
+        super().setUp()
+        aws=mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.cold_options={
+            'bucket':'files-test',
+            'access_key':'testing',
+            'secret_key':'testing',
+            'region_name':'us-east-1',
+            'multipart_chunk_size':5*1024*1024,
+            'read_chunk_size':64*1024,
+        }
+        self.cold=ObjectStorage(**self.cold_options)
+        self.cold.client.create_bucket(Bucket='files-test')
+
+    def test_large_files_are_uploaded_in_parts(self):
+        data=random.Random(1).randbytes(11*1024*1024)
+        name=self.cold.save('userfiles/big.bin', ContentFile(data))
+
+        head=self.cold.client.head_object(Bucket='files-test', Key=name)
+        self.assertEqual(head['ContentLength'], len(data))
+        # S3 ETags of multipart uploads end in -<number of parts>
+        self.assertTrue(head['ETag'].strip('"').endswith('-3'))
+
+    def test_reads_are_ranged_gets(self):
+        data=random.Random(2).randbytes(300*1024)
+        name=self.cold.save('userfiles/ranged.bin', ContentFile(data))
+
+        client=self.cold.client
+        with mock.patch.object(client, 'get_object', wraps=client.get_object) as get_object:
+            with self.cold.open(name) as handle:
+                handle.seek(200*1024)
+                self.assertEqual(handle.read(10), data[200*1024:200*1024+10])
+                handle.seek(5)
+                self.assertEqual(handle.read(5), data[5:10])
+
+        self.assertEqual(
+            [call.kwargs['Range'] for call in get_object.call_args_list],
+            [f"bytes={200*1024}-{200*1024+64*1024-1}", f"bytes=5-{5+64*1024-1}"]
+        )
+
+    def test_tier_files_moves_stale_files_to_cold(self):
+        storages={
+            **settings.STORAGES,
+            'default':{
+                'BACKEND':'files.storage.TieredStorage',
+                'OPTIONS':{'hot':{}, 'cold':self.cold_options},
+            },
+        }
+        with override_settings(STORAGES=storages):
+            storage=File._meta.get_field('file').storage
+            user=User.objects.create(email='tiers@example.com')
+            stale=self._stored_file(storage, user, 'aa', b'stale')
+            fresh=self._stored_file(storage, user, 'bb', b'fresh')
+            File.objects.filter(pk=stale.pk).update(last_accessed_at=timezone.now()-timedelta(days=60))
+
+            call_command('tier_files', days=30, stdout=io.StringIO())
+
+            stale.refresh_from_db()
+            fresh.refresh_from_db()
+            self.assertEqual(stale.storage_tier, File.TIER_COLD)
+            self.assertEqual(fresh.storage_tier, File.TIER_HOT)
+            self.assertFalse(storage.hot.exists(stale.file.name))
+            self.assertTrue(storage.cold.exists(stale.file.name))
+            # reads fall back to the cold tier
+            with storage.open(stale.file.name) as handle:
+                self.assertEqual(handle.read(), b'stale')
+
+            storage.move_to_hot(stale.file.name)
+            self.assertTrue(storage.hot.exists(stale.file.name))
+            self.assertFalse(storage.cold.exists(stale.file.name))
+
+    def _stored_file(self, storage, user, key, data):
+        name=storage.save(f"userfiles/{key*16}.txt", ContentFile(data))
+        return File.objects.create(
+            user=user,
+            file=name,
+            original_name=f"{key}.txt",
+            file_size=len(data),
+            content_type='text/plain',
+            checksum=key*16
+        )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now=time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@override_settings(
+    DOWNLOAD_MAX_STREAMS_GLOBAL=10,
+    DOWNLOAD_MAX_STREAMS_PER_USER=4,
+    DOWNLOAD_MAX_STREAMS_PER_TOKEN=2,
+    DOWNLOAD_STREAM_LEASE_SECONDS=60,
+    DOWNLOAD_RETRY_AFTER=5
+)
+class DownloadGovernorTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.clock=FakeClock()
+        for name in ('time', 'monotonic'):
+            patcher=mock.patch(f'time.{name}', self.clock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_slots_are_taken_and_released(self):
+        first=throttling.acquire_download(token='share')
+        second=throttling.acquire_download(token='share')
+        with self.assertRaises(throttling.DownloadLimitExceeded):
+            throttling.acquire_download(token='share')
+
+        first.release()
+        first.release()
+        third=throttling.acquire_download(token='share')
+        # the failed acquire gave its global slot back
+        self.assertEqual(len(cache.get_many([f'downloads:streams:global:{slot}' for slot in range(10)])), 2)
+        for lease in (second, third):
+            lease.release()
+        self.assertFalse(cache.get_many([f'downloads:streams:global:{slot}' for slot in range(10)]))
+
+    def test_full_pool_answers_429_with_retry_after(self):
+        user=User.objects.create(email='governor@example.com')
+        leases=[throttling.acquire_download(user_id=user.pk) for _ in range(4)]
+        client=APIClient()
+        client.force_authenticate(user)
+
+        response=client.get(reverse('files:file-download', args=[uuid.uuid4()]))
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
+        for lease in leases:
+            lease.release()
+
+    def test_slots_of_a_dead_stream_expire(self):
+        throttling.acquire_download(token='share')
+        throttling.acquire_download(token='share')
+
+        # the workers were killed, nothing releases the leases
+        self.clock.now+=61
+        later=throttling.acquire_download(token='share')
+        throttling.acquire_download(token='share')
+        with self.assertRaises(throttling.DownloadLimitExceeded):
+            throttling.acquire_download(token='share')
+        later.release()
+
+    def test_late_release_of_a_lapsed_lease_keeps_the_new_holder(self):
+        stale=throttling.acquire_download(token='share')
+        self.clock.now+=61
+        holders=[throttling.acquire_download(token='share') for _ in range(2)]
+
+        stale.release()
+
+        with self.assertRaises(throttling.DownloadLimitExceeded):
+            throttling.acquire_download(token='share')
+        for lease in holders:
+            lease.release()
+
+    @override_settings(DOWNLOAD_MAX_STREAMS_PER_TOKEN=1)
+    def test_streaming_refreshes_the_lease(self):
+        lease=throttling.acquire_download(token='share')
+        clock=self.clock
+
+        def chunks():
+            for _ in range(4):
+                # each chunk takes most of a lease period to send
+                clock.now+=40
+                yield b'x'
+
+        stream=throttling._throttled(chunks(), lease, 0)
+        for _ in range(4):
+            next(stream)
+            with self.assertRaises(throttling.DownloadLimitExceeded):
+                throttling.acquire_download(token='share')
+        stream.close()
+        self.assertTrue(lease.released)
+
+
+@override_settings(SHARE_SIGNED_URL_TTL=300)
+class SignedDownloadTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.clock=FakeClock()
+        # a second into a TTL window
+        self.clock.now=float((int(time.time())//300+1)*300+1)
+        patcher=mock.patch('time.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user=User.objects.create(email='signed@example.com')
+        name=self.storage.save('userfiles/signed.txt', ContentFile(b'signed content'))
+        self.file=File.objects.create(
+            user=self.user, file=name, original_name='signed.txt', file_size=14, content_type='text/plain'
+        )
+        self.share=FileShareLink.objects.create(
+            file=self.file,
+            owner=self.user,
+            recipient_email='friend@example.com',
+            share_token='signed-share',
+            expiration_datetime=timezone.now()+timedelta(days=1)
+        )
+        self.client=APIClient()
+
+    def _get(self, token):
+        return self.client.get(reverse('files:signed-file-download', args=[token]))
+
+    def test_download_makes_no_database_query(self):
+        token=signing.sign_download(self.share)
+        with self.assertNumQueries(0):
+            response=self._get(token)
+            body=b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, b'signed content')
+
+    def test_tampered_token_is_rejected(self):
+        token=signing.sign_download(self.share)
+        value, signature=token.rsplit(':', 1)
+        # another blob under the original signature
+        payload=signing.verify_download(token)
+        forged=signing._signer().sign_object({**payload, 'n':'userfiles/other.txt'}).rsplit(':', 1)[0]
+        for bad in (f"{value}:{signature[::-1]}", f"{forged}:{signature}"):
+            response=self._get(bad)
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(response.json()['error'], "Invalid download link")
+
+    def test_token_of_another_scope_is_rejected(self):
+        response=self._get(signing.sign_download(self.share, scope='preview'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_expired_token_answers_410(self):
+        token=signing.sign_download(self.share)
+        self.clock.now+=2*300
+        response=self._get(token)
+        self.assertEqual(response.status_code, 410)
+
+    def test_revoked_share_answers_403(self):
+        token=signing.sign_download(self.share)
+        signing.revoke_shares([self.share.id])
+        response=self._get(token)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['error'], "Download link have been revoked")
+
+    def test_urls_signed_within_a_window_are_identical(self):
+        signed_at=self.clock.now
+        first=signing.sign_download(self.share)
+        self.clock.now+=250
+        self.assertEqual(signing.sign_download(self.share), first)
+        self.clock.now+=100
+        self.assertNotEqual(signing.sign_download(self.share), first)
+
+        # a window boundary, between one and two TTLs away
+        expires_at=signing.verify_download(first)['e']
+        self.assertEqual(expires_at%300, 0)
+        self.assertTrue(300<=expires_at-signed_at<=600)
+
+    def test_expiry_is_capped_at_the_share_expiry(self):
+        self.share.expiration_datetime=datetime.fromtimestamp(self.clock.now+60, tz=dt_timezone.utc)
+        payload=signing.verify_download(signing.sign_download(self.share))
+        self.assertEqual(payload['e'], int(self.share.expiration_datetime.timestamp()))
+
+
+@override_settings(FILE_CHUNK_DEDUP=False)
+class StorageUsageTests(MediaRootMixin, TestCase):
+    """
+    storage_used must always equal the size of the user's live files
+    """
+    def setUp(self):
+        super().setUp()
+        self.user=User.objects.create(email='quota@example.com')
+        self.other=User.objects.create(email='quota-other@example.com')
+
+    def _upload(self, user, name, data, content_type='text/plain'):
+        [row]=FileService.upload_files(user, [SimpleUploadedFile(name, data, content_type=content_type)])
+        return row
+
+    def _assert_usage(self, user, expected):
+        live=sum(File.objects.filter(user=user, is_deleted=False).values_list('file_size', flat=True))
+        self.assertEqual(live, expected)
+        self.assertEqual(FileService.storage_usage(user), expected)
+
+    def test_uploads_count_every_row_including_duplicates(self):
+        self._upload(self.user, 'a.txt', b'hello')
+        duplicate=self._upload(self.user, 'b.txt', b'hello')
+        self._upload(self.other, 'c.txt', b'hello')
+
+        self.assertTrue(duplicate['is_duplicate'])
+        self._assert_usage(self.user, 10)
+        self._assert_usage(self.other, 5)
+
+    def test_single_delete(self):
+        row=self._upload(self.user, 'a.txt', b'hello')
+        self._upload(self.user, 'b.txt', b'abc')
+
+        FileService.user_delete_file(self.user, row['id'])
+
+        self._assert_usage(self.user, 3)
+
+    def test_bulk_delete_and_restore_by_ids_ignore_other_users(self):
+        mine=self._upload(self.user, 'a.txt', b'hello')
+        self._upload(self.user, 'b.txt', b'abc')
+        theirs=self._upload(self.other, 'c.txt', b'other')
+        ids=[mine['id'], theirs['id']]
+
+        result=FileService.bulk_set_deleted(self.user, True, ids=ids)
+
+        self.assertEqual(result, {'count':1, 'size':5})
+        self._assert_usage(self.user, 3)
+        self._assert_usage(self.other, 5)
+        self.assertFalse(File.objects.get(id=theirs['id']).is_deleted)
+
+        FileService.bulk_set_deleted(self.other, True, ids=[theirs['id']])
+        result=FileService.bulk_set_deleted(self.user, False, ids=ids)
+
+        self.assertEqual(result, {'count':1, 'size':5})
+        self._assert_usage(self.user, 8)
+        self._assert_usage(self.other, 0)
+        self.assertTrue(File.objects.get(id=theirs['id']).is_deleted)
+
+    def test_bulk_delete_and_restore_by_filter(self):
+        self._upload(self.user, 'a.txt', b'hello')
+        self._upload(self.user, 'b.png', b'image', content_type='image/png')
+        self._upload(self.other, 'c.png', b'other', content_type='image/png')
+
+        FileService.bulk_set_deleted(self.user, True, filters={'content_type':'image/'})
+
+        self._assert_usage(self.user, 5)
+        self._assert_usage(self.other, 5)
+
+        FileService.bulk_set_deleted(self.user, False, filters={'content_type':'image/'})
+
+        self._assert_usage(self.user, 10)
+
+    def test_restore_over_the_quota_changes_nothing(self):
+        row=self._upload(self.user, 'a.txt', b'hello')
+        FileService.bulk_set_deleted(self.user, True, ids=[row['id']])
+        self._upload(self.user, 'b.txt', b'abc')
+
+        with override_settings(USER_STORAGE_QUOTA=7):
+            with self.assertRaises(QuotaExceeded):
+                FileService.bulk_set_deleted(self.user, False, ids=[row['id']])
+
+        self._assert_usage(self.user, 3)
+        self.assertTrue(File.objects.get(id=row['id']).is_deleted)
+
+
+class StorageUsedBackfillTests(TransactionTestCase):
+    before=[('files', '0013_file_sync_index')]
+    after=[('files', '0014_user_storage_used')]
+
+    def tearDown(self):
+        executor=MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_counts_live_files_of_each_user(self):
+        executor=MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps=executor.loader.project_state(self.before).apps
+        OldUser=apps.get_model('files', 'User')
+        OldFile=apps.get_model('files', 'File')
+        busy=OldUser.objects.create(email='busy@example.com')
+        OldUser.objects.create(email='idle@example.com')
+        for size, deleted in ((5, False), (7, False), (11, True)):
+            OldFile.objects.create(
+                user=busy, original_name='a.txt', file_size=size, content_type='text/plain', is_deleted=deleted
+            )
+
+        executor=MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps=executor.loader.project_state(self.after).apps
+        usage=dict(apps.get_model('files', 'User').objects.values_list('email', 'storage_used'))
+
+        self.assertEqual(usage, {'busy@example.com':12, 'idle@example.com':0})
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class OwnerShareListTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner=User.objects.create(email='owner@example.com')
+        self.other=User.objects.create(email='owner-other@example.com')
+        self.file=self._file(self.owner, 'a.txt')
+        self.client=APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def _file(self, user, name):
+        return File.objects.create(user=user, original_name=name, file_size=1, content_type='text/plain')
+
+    def _share(self, file, hours=24, **fields):
+        return FileShareLink.objects.create(
+            file=file,
+            owner=file.user,
+            recipient_email='friend@example.com',
+            share_token=uuid.uuid4().hex,
+            expiration_datetime=timezone.now()+timedelta(hours=hours),
+            **fields
+        )
+
+    def _list(self, **params):
+        response=self.client.get(reverse('files:share-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self._share(self.file)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self._list()['results']), 1)
+
+        files=[self._file(self.owner, f"{n}.txt") for n in range(49)]
+        for file in files:
+            self._share(file)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self._list()['results']), 50)
+
+    def test_filters(self):
+        active=self._share(self.file, accessed=True)
+        expired=self._share(self.file, hours=-1)
+        revoked=self._share(self.file, is_active=False)
+        elsewhere=self._share(self._file(self.owner, 'b.txt'))
+        self._share(self._file(self.other, 'c.txt'))
+
+        def ids(**params):
+            return {row['id'] for row in self._list(**params)['results']}
+
+        self.assertEqual(ids(), {str(share.id) for share in (active, expired, revoked, elsewhere)})
+        self.assertEqual(ids(status='active'), {str(active.id), str(elsewhere.id)})
+        self.assertEqual(ids(status='expired'), {str(expired.id)})
+        self.assertEqual(ids(status='revoked'), {str(revoked.id)})
+        self.assertEqual(ids(accessed='true'), {str(active.id)})
+        self.assertEqual(ids(file=self.file.id, status='active'), {str(active.id)})
+
+    def test_share_url_points_at_the_public_route(self):
+        share=self._share(self.file)
+        [row]=self._list()['results']
+        self.assertEqual(
+            row['share_url'],
+            'http://testserver'+reverse('files:public-file-access', args=[share.share_token])
+        )
+
+    def test_bulk_revoke_ignores_shares_of_other_owners(self):
+        mine=self._share(self.file)
+        theirs=self._share(self._file(self.other, 'c.txt'))
+
+        response=self.client.post(
+            reverse('files:share-bulk-revoke'), {'ids':[str(mine.id), str(theirs.id)]}, format='json'
+        )
+
+        self.assertEqual(response.json()['revoked'], 1)
+        mine.refresh_from_db()
+        theirs.refresh_from_db()
+        self.assertFalse(mine.is_active)
+        self.assertTrue(theirs.is_active)
+        self.assertTrue(signing.is_revoked(mine.id))
+        self.assertFalse(signing.is_revoked(theirs.id))
+
+
+@override_settings(DATABASE_REPLICAS=[], FILE_CHUNK_DEDUP=False, FILE_LIST_CACHE_PAGE_SIZE=2)
+class FileListViewTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user=User.objects.create(email='lister@example.com')
+        self.client=APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.rows=FileService.upload_files(self.user, [
+            SimpleUploadedFile(f"{n}.txt", f"file {n}".encode()) for n in range(5)
+        ])
+
+    def _list(self, etag=None):
+        headers={'HTTP_IF_NONE_MATCH':etag} if etag else {}
+        response=self.client.get(reverse('files:file-list'), **headers)
+        body=b''.join(response.streaming_content) if response.status_code==200 else None
+        return response, body
+
+    def test_revalidation_answers_304_without_queries(self):
+        response, _=self._list()
+        with self.assertNumQueries(0):
+            revalidated, _=self._list(response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_cached_body_matches_a_fresh_one(self):
+        response, fresh=self._list()
+        with self.assertNumQueries(0):
+            _, cached=self._list()
+        self.assertEqual(cached, fresh)
+        self.assertEqual(
+            sorted(row['original_name'] for row in json.loads(cached)),
+            [f"{n}.txt" for n in range(5)]
+        )
+
+    def test_version_changes_after_upload_delete_and_restore(self):
+        etags=[self._list()[0]['ETag']]
+
+        def changed():
+            response, body=self._list(etags[-1])
+            self.assertEqual(response.status_code, 200)
+            etags.append(response['ETag'])
+            return {row['original_name'] for row in json.loads(body)}
+
+        # versions change once the writes commit
+        with self.captureOnCommitCallbacks(execute=True):
+            FileService.upload_files(self.user, [SimpleUploadedFile('new.txt', b'new')])
+        self.assertIn('new.txt', changed())
+        with self.captureOnCommitCallbacks(execute=True):
+            FileService.user_delete_file(self.user, self.rows[0]['id'])
+        self.assertNotIn('0.txt', changed())
+        with self.captureOnCommitCallbacks(execute=True):
+            FileService.bulk_set_deleted(self.user, False, ids=[self.rows[0]['id']])
+        self.assertIn('0.txt', changed())
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_inactive_or_deleted_user_gets_no_new_body(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response, _=self._list()
+        self.assertEqual(response.status_code, 401)
+
+        User.objects.filter(pk=self.user.pk).delete()
+        response, _=self._list()
+        self.assertEqual(response.status_code, 401)
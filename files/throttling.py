@@ -0,0 +1,150 @@
+"""
+Concurrency and bandwidth governor for download streams.
+A pool with a limit of N streams has N slot keys in the Django cache, a
+stream holds a slot by adding its key and keeps it alive while it sends.
+The limits hold across worker processes with a shared cache backend
+(Redis, Memcached) in production.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket, consume() blocks until enough tokens are available
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate=rate
+        self.capacity=capacity or rate
+        self.tokens=self.capacity
+        self.updated=time.monotonic()
+        self.lock=threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now=time.monotonic()
+                self.tokens=min(self.capacity, self.tokens+(now-self.updated)*self.rate)
+                self.updated=now
+                # requests bigger than the bucket go through once it is full
+                if self.tokens>=amount or self.tokens>=self.capacity:
+                    self.tokens-=amount
+                    return
+                wait=(min(amount, self.capacity)-self.tokens)/self.rate
+            time.sleep(wait)
+
+
+class DownloadLimitExceeded(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after=retry_after
+
+
+class DownloadLease:
+    """
+    slots held by one download stream. They expire unless refreshed, so the
+    slots of a killed worker free up after DOWNLOAD_STREAM_LEASE_SECONDS
+    """
+    def __init__(self):
+        self.id=uuid.uuid4().hex
+        self.slots=[]
+        self.refreshed=time.monotonic()
+        self.released=False
+
+    def take(self, pool, limit):
+        """
+        add the first free slot key of the pool, False when all are live
+        """
+        keys=[f'{pool}:{slot}' for slot in range(limit)]
+        live=cache.get_many(keys)
+        for key in keys:
+            if key not in live and cache.add(key, self.id, timeout=settings.DOWNLOAD_STREAM_LEASE_SECONDS):
+                self.slots.append(key)
+                return True
+        return False
+
+    def refresh(self):
+        """
+        extend the slots, at most a few times per lease period
+        """
+        now=time.monotonic()
+        if self.released or now-self.refreshed<settings.DOWNLOAD_STREAM_LEASE_SECONDS/3:
+            return
+        self.refreshed=now
+        owners=cache.get_many(self.slots)
+        for key in self.slots:
+            if owners.get(key)==self.id:
+                cache.touch(key, timeout=settings.DOWNLOAD_STREAM_LEASE_SECONDS)
+            elif key not in owners:
+                # lapsed while a chunk was blocked, taken back unless reused
+                cache.add(key, self.id, timeout=settings.DOWNLOAD_STREAM_LEASE_SECONDS)
+
+    def release(self):
+        if self.released:
+            return
+        self.released=True
+        # a lapsed slot may belong to another stream by now
+        owners=cache.get_many(self.slots)
+        cache.delete_many([key for key in self.slots if owners.get(key)==self.id])
+
+
+def acquire_download(user_id=None, token=None):
+    """
+    take a stream slot in the global, per-user and per-token pools,
+    raises DownloadLimitExceeded when any of them is full
+    """
+    pools=[('downloads:streams:global', settings.DOWNLOAD_MAX_STREAMS_GLOBAL)]
+    if user_id is not None:
+        pools.append((f'downloads:streams:user:{user_id}', settings.DOWNLOAD_MAX_STREAMS_PER_USER))
+    if token is not None:
+        token_key=hashlib.sha256(str(token).encode()).hexdigest()[:32]
+        pools.append((f'downloads:streams:token:{token_key}', settings.DOWNLOAD_MAX_STREAMS_PER_TOKEN))
+
+    lease=DownloadLease()
+    for pool, limit in pools:
+        if limit and not lease.take(pool, limit):
+            lease.release()
+            raise DownloadLimitExceeded(
+                "Too many downloads in progress, try again later",
+                settings.DOWNLOAD_RETRY_AFTER
+            )
+    return lease
+
+
+def _throttled(chunks, lease, rate):
+    bucket=TokenBucket(rate)
+    try:
+        for chunk in chunks:
+            bucket.consume(len(chunk))
+            lease.refresh()
+            yield chunk
+    finally:
+        lease.release()
+
+
+def govern_response(response, lease):
+    """
+    cap the stream's bandwidth and free its slots when it finishes or is closed
+    """
+    response.streaming_content=_throttled(
+        response.streaming_content,
+        lease,
+        settings.DOWNLOAD_BANDWIDTH_PER_STREAM
+    )
+    # a stream closed before its first chunk never runs the generator's finally
+    response._resource_closers.append(lease.release)
+    return response
+
+
+def limit_exceeded_response(error):
+    response=JsonResponse({'error':str(error)}, status=429)
+    response['Retry-After']=str(error.retry_after)
+    return response
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+# room for multipart boundaries, part headers and the plain form fields
+MULTIPART_OVERHEAD_ALLOWANCE=64*1024
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """
+    Stops a multipart upload as soon as it crosses the per-file cap or the
+    user's remaining quota, before the rest of the body is spooled to disk.
+    Must run ahead of the default handlers so over-limit chunks never reach them.
+    The view checks `error` after the request body has been parsed.
+    """
+    def __init__(self, remaining, max_file_size, request=None):
+        super().__init__(request)
+        self.remaining=remaining
+        self.max_file_size=max_file_size
+        self.total_size=0
+        self.file_size=0
+        self.error=None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length>self.remaining+MULTIPART_OVERHEAD_ALLOWANCE:
+            self.error=self._quota_message()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.error:
+            # raised before the default handlers open their temp file
+            raise StopUpload(connection_reset=True)
+        self.file_size=0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_size+=len(raw_data)
+        self.total_size+=len(raw_data)
+        if self.file_size>self.max_file_size:
+            self.error=(
+                f"File '{self.file_name}' exceeds maximum size of "
+                f"{self.max_file_size//(1024*1024)}MB"
+            )
+        elif self.total_size>self.remaining:
+            self.error=self._quota_message()
+        if self.error:
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def _quota_message(self):
+        return (
+            f"Insufficient storage space. Only {max(self.remaining, 0)} left. "
+            "Try deleting some files!"
+        )
+
+
+def staging_directory():
+    """
+    staging area on the same volume as the stored files, so a staged
+    upload can be renamed into place instead of copied
+    """
+    storage=getattr(default_storage, 'hot', default_storage)
+    path=os.path.join(storage.location, settings.FILE_UPLOAD_STAGING_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    Upload spooled into the media staging area, with its MD5 computed while
+    it was received. FileSystemStorage moves files exposing
+    temporary_file_path() with os.rename, so no byte is written twice.
+    """
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext=os.path.splitext(name)
+        file=tempfile.NamedTemporaryFile(suffix=".upload"+ext, dir=staging_directory())
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.checksum=None
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # the file was moved into storage, nothing to delete
+            pass
+
+
+class StagedFileUploadHandler(FileUploadHandler):
+    """
+    Writes uploads straight into the media staging area and hashes them on the way
+    """
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file=StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.hash=hashlib.md5()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.hash.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size=file_size
+        self.file.checksum=self.hash.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
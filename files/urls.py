@@ -1,6 +1,8 @@
 from django.urls import path
 from files.views import (
-    RegisterView, LoginView, FileUploadView, FileDownloadView, FileListView, FileDeleteView, FileShareCreateView, PublicFileAccessView
+    RegisterView, LoginView, FileUploadView, FileDownloadView, FileListView, FileDeleteView, FileShareCreateView, PublicFileAccessView,
+    StorageDedupView, SignedFileDownloadView, OwnerShareListView, ShareBulkRevokeView,
+    HotFileCacheStatsView, FileChangesView, FileBulkDeleteView, FileBulkRestoreView
     )
 """
     app level urls
@@ -15,8 +17,16 @@ urlpatterns=[
     path('file-upload', FileUploadView.as_view(), name='file-upload'),
     path('<uuid:file_id>/file-download/', FileDownloadView.as_view(), name='file-download'),
     path('file-list/', FileListView.as_view(), name='file-list'),
+    path('file-changes/', FileChangesView.as_view(), name='file-changes'),
     path('<uuid:file_id>/file-delete/', FileDeleteView.as_view(), name='file-delete'),
+    path('file-delete/bulk/', FileBulkDeleteView.as_view(), name='file-bulk-delete'),
+    path('file-restore/bulk/', FileBulkRestoreView.as_view(), name='file-bulk-restore'),
+    path('storage/dedup/', StorageDedupView.as_view(), name='storage-dedup'),
+    path('storage/hot-cache/', HotFileCacheStatsView.as_view(), name='hot-cache-stats'),
     #file share and download urls
     path('files/<uuid:file_id>/share/', FileShareCreateView.as_view(), name='share-create'),
+    path('shares/', OwnerShareListView.as_view(), name='share-list'),
+    path('shares/revoke/', ShareBulkRevokeView.as_view(), name='share-bulk-revoke'),
     path('files/public/<str:token>/', PublicFileAccessView.as_view(), name='public-file-access'),
+    path('files/signed/<str:token>/', SignedFileDownloadView.as_view(), name='signed-file-download'),
 ]
\ No newline at end of file
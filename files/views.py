@@ -1,14 +1,30 @@
 from django.shortcuts import render
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import FileResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.pagination import PageNumberPagination
+from django.http import FileResponse, HttpResponseRedirect, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from django.urls import reverse
+import time
+from django.conf import settings
 from files.serializers import (
-    RegisterSerializer, LoginSerializer, FileUploadSerialzier, FilesListSerializer, FileShareSerializer, FileShareCreateSerializer, PublicFileSerializer
+    RegisterSerializer, LoginSerializer, FileUploadSerialzier, FilesListSerializer, FileShareSerializer, FileShareCreateSerializer, PublicFileSerializer,
+    ShareFilterSerializer, ShareRevokeSerializer, FileChangesQuerySerializer, BulkFileActionSerializer
     )
 from files.services import (
-    create_user, authenticate_and_generate_token, AuthenticationError ,FileService, FileShareService, ViewFileShareService
+    create_user, authenticate_and_generate_token, user_is_active, AuthenticationError ,FileService, FileShareService, ViewFileShareService,
+    ChunkDedupService, QuotaExceeded
+    )
+from files.upload_handlers import QuotaUploadHandler
+from files.signing import SignedURLError
+from files.hotcache import hot_file_cache
+from files.listcache import list_version, list_etag, cached_list, cache_list
+from files.throttling import (
+    acquire_download, govern_response, limit_exceeded_response, DownloadLimitExceeded
     )
 
 
@@ -73,10 +89,23 @@ class FileUploadView(APIView):
     permission_classes=[IsAuthenticated]
     
     def post(self, request):
+        # the body hasn't been parsed yet, so the quota handler can still be
+        # put in front of the default handlers
+        quota_handler=QuotaUploadHandler(
+            remaining=FileService.remaining_storage(request.user),
+            max_file_size=settings.FILE_MAX_UPLOAD_SIZE,
+            request=request._request
+        )
+        request.upload_handlers.insert(0, quota_handler)
         serializer=FileUploadSerialzier(
             data=request.data,
             context={'request':request}
             )
+        if quota_handler.error:
+            return Response(
+                {'files':[quota_handler.error]},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
         if not serializer.is_valid():
             return Response(
                 serializer.errors,
@@ -101,19 +130,87 @@ class FileUploadView(APIView):
 class FileDownloadView(APIView):
     permission_classes=[IsAuthenticated]
     def get(self, request, file_id):
-        return FileService.download_file(request.user, file_id)
+        try:
+            lease=acquire_download(user_id=request.user.pk)
+        except DownloadLimitExceeded as e:
+            return limit_exceeded_response(e)
+        try:
+            response=FileService.download_file(request.user, file_id)
+        except Exception:
+            lease.release()
+            raise
+        return govern_response(response, lease)
 
 class FileListView(APIView):
+    """
+    The user comes from the token claims, so a revalidation answered with
+    304 makes no database query. Bodies are served from the list cache
+    until the user's list version changes, a new body is only built for
+    a user that still exists and is active.
+    """
+    authentication_classes=[JWTStatelessUserAuthentication]
     permission_classes=[IsAuthenticated]
     serializer_class=FilesListSerializer
 
     def get(self, request):
-        user_files=FileService.user_list_files(
-            user=request.user
+        user_id=request.user.id
+        version=list_version(user_id)
+        etag=list_etag(user_id, version)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response=HttpResponseNotModified()
+            response['ETag']=etag
+            return response
+
+        body=cached_list(user_id, version)
+        if body is None:
+            if not user_is_active(user_id):
+                raise AuthenticationFailed("User is inactive", code='user_inactive')
+            # values() rows streamed straight to JSON instead of a serializer per row.
+            # After a write the user reads the primary for the lag tolerance,
+            # so rows of a lagging replica aren't cached under the new version
+            rows=FileService.iter_user_files(
+                user=user_id,
+                fields=self.serializer_class.Meta.fields,
+                batch_size=settings.FILE_LIST_CACHE_PAGE_SIZE
+            )
+            body=cache_list(user_id, version, rows)
+        response=StreamingHttpResponse(body, content_type='application/json')
+        response['ETag']=etag
+        response['Cache-Control']='private, no-cache'
+        return response
+
+class FileChangesView(APIView):
+    """
+    changes to the user's files since a cursor, for sync clients.
+    Without a cursor it starts from the first file
+    """
+    permission_classes=[IsAuthenticated]
+
+    def get(self, request):
+        query=FileChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        cursor=query.validated_data.get('cursor')
+        result=FileService.changes_since(
+            user=request.user,
+            fields=FilesListSerializer.Meta.fields,
+            after=query.position if cursor else None,
+            limit=query.validated_data['limit']
         )
-        serializer = self.serializer_class(user_files, many=True)
+        # nothing new, the client keeps polling from where it was
+        result['cursor']=result['cursor'] or cursor
+        return Response(result)
+
+class StorageDedupView(APIView):
+    permission_classes=[IsAuthenticated]
 
-        return Response(serializer.data)
+    def get(self, request):
+        return Response(ChunkDedupService.dedup_stats(request.user))
+
+class HotFileCacheStatsView(APIView):
+    permission_classes=[IsAdminUser]
+
+    def get(self, request):
+        return Response(hot_file_cache.stats())
 
 class FileDeleteView(APIView):
     permission_classes=[IsAuthenticated]
@@ -128,6 +225,27 @@ class FileDeleteView(APIView):
             status=status.HTTP_204_NO_CONTENT
         )
     
+class FileBulkDeleteView(APIView):
+    permission_classes=[IsAuthenticated]
+    deleted=True
+
+    def post(self, request):
+        serializer=BulkFileActionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result=FileService.bulk_set_deleted(
+                request.user,
+                deleted=self.deleted,
+                ids=serializer.validated_data.get('ids'),
+                filters=serializer.validated_data.get('filter')
+            )
+        except QuotaExceeded as e:
+            return Response({'detail':str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
+
+class FileBulkRestoreView(FileBulkDeleteView):
+    deleted=False
+
 class FileShareCreateView(APIView):
     permission_classes=[IsAuthenticated]
 
@@ -158,6 +276,43 @@ class FileShareCreateView(APIView):
         return Response(serializer.errors, status=400)
     
 
+class SharePagination(PageNumberPagination):
+    page_size=50
+    page_size_query_param='page_size'
+    max_page_size=200
+
+class OwnerShareListView(APIView):
+    """
+    the owner's outgoing shares, one COUNT and one page query per request
+    """
+    permission_classes=[IsAuthenticated]
+
+    def get(self, request):
+        filters=ShareFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        shares=FileShareService.owner_shares(
+            owner=request.user,
+            status=filters.validated_data.get('status'),
+            accessed=filters.validated_data.get('accessed'),
+            file_id=filters.validated_data.get('file')
+        )
+        paginator=SharePagination()
+        page=paginator.paginate_queryset(shares, request, view=self)
+        serializer=FileShareSerializer(page, many=True, context={'request':request})
+        return paginator.get_paginated_response(serializer.data)
+
+class ShareBulkRevokeView(APIView):
+    permission_classes=[IsAuthenticated]
+
+    def post(self, request):
+        serializer=ShareRevokeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        revoked=FileShareService.bulk_revoke(request.user, serializer.validated_data['ids'])
+        return Response(
+            {'message':f'{revoked} shares revoked', 'revoked':revoked},
+            status=status.HTTP_200_OK
+        )
+
 class PublicFileAccessView(APIView):
     permission_classes=[]
 
@@ -172,10 +327,57 @@ class PublicFileAccessView(APIView):
 
         ViewFileShareService.mark_as_accessed(share)
 
-        file_obj, filename = ViewFileShareService.get_file_response(share)
+        if settings.SHARE_SIGNED_URLS:
+            signed_token=ViewFileShareService.get_signed_download_token(share)
+            return HttpResponseRedirect(
+                reverse('files:signed-file-download', args=[signed_token])
+            )
 
-        return FileResponse(
+        try:
+            lease=acquire_download(token=share.id)
+        except DownloadLimitExceeded as e:
+            return limit_exceeded_response(e)
+        try:
+            file_obj, filename = ViewFileShareService.get_file_response(share)
+        except Exception:
+            lease.release()
+            raise
+
+        return govern_response(FileResponse(
                 file_obj,
                 as_attachment=False,
                 filename=filename
-        )
\ No newline at end of file
+        ), lease)
+
+class SignedFileDownloadView(APIView):
+    """
+    serves share downloads from a signed token, no database access,
+    so the response can be cached by a proxy until the token expires
+    """
+    authentication_classes=[]
+    permission_classes=[]
+
+    def get(self, request, token):
+        try:
+            payload=ViewFileShareService.verify_signed_download(token)
+        except SignedURLError as e:
+            status_code=410 if 'expired' in str(e) else 403
+            return Response({'error':str(e)}, status=status_code)
+        # same slots as the share link itself
+        try:
+            lease=acquire_download(token=payload['s'])
+        except DownloadLimitExceeded as e:
+            return limit_exceeded_response(e)
+        try:
+            file_obj=ViewFileShareService.open_signed_download(payload)
+        except FileNotFoundError:
+            lease.release()
+            return Response({'error':'File not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        response=FileResponse(
+                file_obj,
+                as_attachment=False,
+                filename=payload['o']
+        )
+        response['Cache-Control']=f"public, max-age={max(int(payload['e']-time.time()), 0)}"
+        return govern_response(response, lease)